@@ -0,0 +1,107 @@
+"""
+Global download bandwidth limit shared by all active downloads
+"""
+
+import itertools
+import re
+import threading
+import time
+
+# Multipliers for rate suffixes, as yt-dlp's --limit-rate understands them
+RATE_UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+
+def parse_rate(value):
+    """Bytes per second for a rate like '500K' or '2.5M'; None for unlimited"""
+    match = re.match(r'^\s*(\d+(?:\.\d+)?)\s*([kmg]?)i?b?(?:/s)?\s*$', str(value or ''), re.IGNORECASE)
+    if not match:
+        return None
+    rate = float(match.group(1)) * RATE_UNITS[match.group(2).lower()]
+    return rate or None
+
+class BandwidthGovernor:
+    """Token-bucket fair share of download.rate_limit between active downloads
+    
+    Every download has its own bucket, refilled at the global limit divided
+    by the number of downloads currently moving data. Downloads that haven't
+    reported any data for STALL_SECONDS don't count, so their share goes to
+    the others, as does the share of downloads that finish. The limit is read
+    from the config on every call and can be changed while downloads run.
+    """
+    
+    # Idle time after which a download's share is handed to the others
+    STALL_SECONDS = 3.0
+    
+    # Tokens a bucket can save up, in seconds of its rate
+    BURST_SECONDS = 1.0
+    
+    # Longest sleep before a paused download's debt is re-evaluated, so limit
+    # changes and freed shares take effect quickly
+    MAX_PAUSE = 0.5
+    
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.Lock()
+        self.buckets = {}  # download id -> {'tokens', 'updated', 'active_until'}
+        self._download_ids = itertools.count()
+        
+    def limit(self):
+        """Global limit in bytes per second, or None for unlimited"""
+        return parse_rate(self.config.get('download', 'rate_limit', fallback='0'))
+        
+    def acquire(self):
+        """Register a starting download; returns its id"""
+        with self.lock:
+            download_id = next(self._download_ids)
+            now = time.monotonic()
+            self.buckets[download_id] = {'tokens': 0.0, 'updated': now, 'active_until': now + self.STALL_SECONDS}
+            return download_id
+            
+    def release(self, download_id):
+        """Unregister a finished download, freeing its share"""
+        with self.lock:
+            self.buckets.pop(download_id, None)
+            
+    def active_downloads(self):
+        """Number of registered downloads"""
+        with self.lock:
+            return len(self.buckets)
+            
+    def consume(self, download_id, nbytes):
+        """Charge received bytes to a download; returns the seconds it should pause"""
+        limit = self.limit()
+        with self.lock:
+            bucket = self.buckets.get(download_id)
+            if bucket is None:
+                return 0.0
+            now = time.monotonic()
+            if limit is None:
+                bucket['tokens'] = 0.0
+                bucket['updated'] = now
+                bucket['active_until'] = now + self.STALL_SECONDS
+                return 0.0
+                
+            # Fair share among downloads that are moving data, this one included
+            active = sum(
+                1 for other_id, other in self.buckets.items()
+                if other_id == download_id or other['active_until'] > now
+            )
+            rate = limit / active
+            
+            bucket['tokens'] = min(bucket['tokens'] + (now - bucket['updated']) * rate, rate * self.BURST_SECONDS)
+            bucket['updated'] = now
+            bucket['tokens'] -= nbytes
+            
+            # A download paying off debt is paused, not stalled
+            wait = -bucket['tokens'] / rate if bucket['tokens'] < 0 else 0.0
+            bucket['active_until'] = now + wait + self.STALL_SECONDS
+            return wait
+            
+    def wait(self, download_id, wait):
+        """Sleep until a download has paid off its debt, at the current share"""
+        while wait > 0:
+            time.sleep(min(wait, self.MAX_PAUSE))
+            wait = self.consume(download_id, 0)
+            
+    def throttle(self, download_id, nbytes):
+        """Charge received bytes and sleep the calling download thread as needed"""
+        self.wait(download_id, self.consume(download_id, nbytes))
@@ -54,12 +54,27 @@ class ConfigManager:
                 'audio_quality': 'best',
                 'extract_audio': 'False',
                 'keep_video': 'True',
-                'embed_subs': 'False'
+                'embed_subs': 'False',
+                'parallel_streams': 'True',
+                'concurrent_fragments': '4',
+                'adaptive_fragments': 'True',
+                'rate_limit': '0'
             },
             'processing': {
                 'ffmpeg_path': 'ffmpeg',
                 'yt_dlp_path': 'yt-dlp',
+                'download_engine': 'auto',
                 'max_concurrent': '2',
+                'priority_aging': '300',
+                'probe_workers': '0',
+                'download_workers': '0',
+                'process_workers': '2',
+                'finalize_workers': '1',
+                'expand_playlists': 'True',
+                'chunked_encoding_threshold': '1800',
+                'chunk_duration': '120',
+                'chunk_workers': '0',
+                'cpu_threads': '0',
                 'auto_process': 'True',
                 'delete_originals': 'False'
             },
@@ -74,7 +89,12 @@ class ConfigManager:
                 'browser_integration': 'True',
                 'auto_start': 'False',
                 'timeout': '60',
-                'retry': '3'
+                'retry': '3',
+                'metadata_cache': 'True',
+                'metadata_cache_ttl': '3600',
+                'metadata_cache_size_mb': '100',
+                'persistent_probe_cache': 'True',
+                'persistent_queue': 'True'
             }
         }
         
@@ -3,20 +3,121 @@ Media downloader using yt-dlp
 """
 
 import os
+import re
+import shutil
+import signal
 import subprocess
 import json
+import tempfile
 import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
 from urllib.parse import urlparse
 
+from core.bandwidth_governor import BandwidthGovernor
+from core.fragment_concurrency import FragmentConcurrency
+from core.format_selector import FormatSelector, codec_name, merge_container, merge_output_format
+from core.metadata_cache import MetadataCache
+from core.progress import DownloadProgress
+from core.ytdlp_engine import YTDLPEngine
+
 class MediaDownloader:
     """Handles downloading media using yt-dlp"""
     
-    def __init__(self, config, logger):
+    # Prefixes for the lines emitted by --print in fused probe-and-download mode
+    INFO_PREFIX = '[media-processor:info] '
+    FILE_PREFIX = '[media-processor:file] '
+    PROGRESS_PREFIX = '[media-processor:progress] '
+    
+    # yt-dlp output lines reporting a failed fragment, and a host throttling us
+    FRAGMENT_RETRY = 'Retrying fragment'
+    THROTTLE_ERROR = re.compile(r'HTTP Error (429|403)')
+    
+    def __init__(self, config, logger, ffmpeg=None):
         self.config = config
         self.logger = logger
+        self.ffmpeg = ffmpeg  # FFMPEGWrapper for joining separately downloaded streams
+        self._ffmpeg_available = None  # Checked on first use
         self.yt_dlp_path = self.config.get('processing', 'yt_dlp_path', fallback='yt-dlp')
         self.active_processes = {}
+        self.format_selector = FormatSelector(config, logger)
+        self.fragment_concurrency = FragmentConcurrency(config)
+        self.bandwidth = BandwidthGovernor(config)  # Shared by every download of this downloader
         
+        # Persistent metadata cache
+        self.metadata_cache = None
+        if self.config.getboolean('advanced', 'metadata_cache', fallback=True):
+            try:
+                self.metadata_cache = MetadataCache(
+                    ttl=self.config.getint('advanced', 'metadata_cache_ttl', fallback=3600),
+                    max_size=self.config.getint('advanced', 'metadata_cache_size_mb', fallback=100) * 1024 * 1024
+                )
+            except Exception as e:
+                self.logger.warning(f"Could not open metadata cache: {str(e)}")
+                
+        # In-process engine, unless a custom yt-dlp binary is configured
+        self.engine = None
+        if self._use_api_engine():
+            self.engine = YTDLPEngine(logger, max_workers=self._engine_workers())
+            self.logger.info("Using in-process yt-dlp engine")
+            
+    def _engine_workers(self):
+        """Engine threads for every queue probe and every download stream at once"""
+        max_concurrent = max(1, self.config.getint('processing', 'max_concurrent', fallback=2))
+        probes = self.config.getint('processing', 'probe_workers', fallback=0) or max_concurrent
+        downloads = self.config.getint('processing', 'download_workers', fallback=0) or max_concurrent
+        
+        # A split download runs its video and audio streams side by side
+        streams = 2 if self.config.getboolean('download', 'parallel_streams', fallback=True) else 1
+        return max(1, probes) + max(1, downloads) * streams
+        
+    def reload_settings(self):
+        """Apply changed concurrency and FFMPEG settings"""
+        self._ffmpeg_available = None
+        if self.engine:
+            self.engine.resize(self._engine_workers())
+            
+    def can_merge(self):
+        """Check whether FFMPEG is available to join separately downloaded streams"""
+        if self._ffmpeg_available is None:
+            if self.ffmpeg is not None:
+                self._ffmpeg_available = self.ffmpeg.is_available()
+            else:
+                self._ffmpeg_available = self._ffmpeg_location() is not None
+        return self._ffmpeg_available
+        
+    def _use_api_engine(self):
+        """Decide whether to use the YoutubeDL API instead of the yt-dlp executable"""
+        engine = self.config.get('processing', 'download_engine', fallback='auto')
+        if engine == 'subprocess':
+            return False
+            
+        if not YTDLPEngine.is_available():
+            if engine == 'api':
+                self.logger.warning("yt_dlp Python package not found, falling back to the yt-dlp executable")
+            return False
+            
+        if self.yt_dlp_path not in ('yt-dlp', 'yt-dlp.exe'):
+            # A custom binary may be a different build or version than the package
+            if engine == 'api':
+                self.logger.warning(f"Custom yt-dlp path configured, using executable: {self.yt_dlp_path}")
+            return False
+            
+        return True
+        
+    def is_yt_dlp_available(self):
+        """Check if yt-dlp is available"""
+        if self.engine:
+            return True
+            
+        try:
+            cmd = [self.yt_dlp_path, '--version']
+            result = subprocess.run(cmd, capture_output=True, timeout=10)
+            return result.returncode == 0
+        except Exception:
+            return False
+            
     def is_supported_url(self, url):
         """Check if URL is supported by yt-dlp"""
         try:
@@ -25,6 +126,11 @@ class MediaDownloader:
             if not parsed.scheme or not parsed.netloc:
                 return False
                 
+            if self.engine:
+                # Only resolve the extractor, don't process formats
+                self.engine.extract_info(url, process=False)
+                return True
+                
             # Test with yt-dlp
             cmd = [self.yt_dlp_path, '--no-download', '--quiet', '--no-warnings', url]
             result = subprocess.run(cmd, capture_output=True, timeout=30)
@@ -36,7 +142,23 @@ class MediaDownloader:
             
     def get_info(self, url):
         """Get media information without downloading"""
+        cached = self.get_cached_info(url)
+        if cached is not None:
+            return cached
+            
+        info = self._get_info(url)
+        self._cache_info(url, info)
+        return info
+        
+    def _get_info(self, url):
+        """Extract media information with yt-dlp"""
         try:
+            if self.engine:
+                try:
+                    return self.engine.extract_info(url)
+                except Exception as e:
+                    raise Exception(f"yt-dlp error: {str(e)}")
+                    
             cmd = [
                 self.yt_dlp_path,
                 '--dump-json',
@@ -60,9 +182,108 @@ class MediaDownloader:
             self.logger.error(f"Error getting media info: {str(e)}")
             raise
             
-    def download(self, url, options=None, progress_callback=None):
-        """Download media from URL"""
+    def get_playlist_entries(self, url):
+        """Expand a playlist into entry URLs using flat extraction
+        
+        Returns (entries, info). For single media entries is None and info
+        holds its full metadata, which is also cached for the download.
+        """
         try:
+            if self.engine:
+                info = self.engine.extract_info(url, {'extract_flat': 'in_playlist'})
+            else:
+                cmd = [
+                    self.yt_dlp_path,
+                    '--dump-single-json',
+                    '--flat-playlist',
+                    '--quiet',
+                    url
+                ]
+                
+                # Large playlists are fetched page by page, allow extra time
+                result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
+                
+                if result.returncode != 0:
+                    raise Exception(f"yt-dlp error: {result.stderr}")
+                info = json.loads(result.stdout)
+                
+        except subprocess.TimeoutExpired:
+            raise Exception("Timeout while expanding playlist")
+        except json.JSONDecodeError as e:
+            raise Exception(f"Failed to parse playlist information: {str(e)}")
+        except Exception as e:
+            self.logger.error(f"Error expanding playlist: {str(e)}")
+            raise
+            
+        if info.get('_type') != 'playlist':
+            self._cache_info(url, info)
+            return None, info
+            
+        entries = []
+        skipped = []
+        for entry in info.get('entries') or []:
+            if not entry:
+                continue
+            # Flat entries may carry only a bare id in 'url', which is
+            # meaningless outside the extractor that produced it
+            entry_url = entry.get('webpage_url') or entry.get('url')
+            parsed = urlparse(entry_url or '')
+            if parsed.scheme and parsed.netloc:
+                entries.append({'url': entry_url, 'title': entry.get('title')})
+            else:
+                skipped.append(entry.get('id') or entry_url or entry.get('title') or '?')
+                
+        if skipped:
+            self.logger.warning(
+                f"Playlist {info.get('title', url)}: skipped {len(skipped)} entries without a URL: "
+                f"{', '.join(str(entry_id) for entry_id in skipped)}"
+            )
+        self.logger.info(f"Playlist {info.get('title', url)}: {len(entries)} entries")
+        return entries, info
+        
+    def download(self, url, options=None, progress_callback=None, with_info=False, info=None):
+        """Download media from URL
+        
+        With with_info=True the same yt-dlp process also validates the URL and
+        emits the metadata JSON, which is returned under the 'info' key. This
+        replaces separate is_supported_url/get_info calls before a download.
+        Passing previously extracted info skips extraction entirely.
+        """
+        if info is not None:
+            try:
+                return self._download(url, options, progress_callback, with_info, info)
+            except Exception as e:
+                # Cached format URLs may have expired; extract again
+                self.logger.warning(f"Download from cached media info failed, retrying: {str(e)}")
+                if self.metadata_cache:
+                    self.metadata_cache.invalidate(url)
+                    
+        result = self._download(url, options, progress_callback, with_info)
+        if with_info:
+            self._cache_info(url, result.get('info'))
+        return result
+        
+    def _download(self, url, options=None, progress_callback=None, with_info=False, info=None, cancel_event=None):
+        """Run a single download through the engine or the yt-dlp executable
+        
+        Setting cancel_event stops the download and makes it raise.
+        """
+        info_file = None
+        try:
+            # Basic URL validation
+            parsed = urlparse(url)
+            if not parsed.scheme or not parsed.netloc:
+                raise Exception("URL not supported by yt-dlp")
+                
+            # The format is chosen for what the job turns the download into
+            format_spec = self.format_selector.select(options, info, self.can_merge())
+            if self._can_split(format_spec, info, options):
+                return self._download_split(url, options, format_spec, progress_callback, with_info, info)
+                
+            if self.engine:
+                return self._download_with_engine(url, options, progress_callback, with_info, info, format_spec,
+                                                  cancel_event)
+                
             download_dir = self.config.get('download', 'directory', 
                                          fallback=os.path.expanduser('~/Downloads'))
             
@@ -90,21 +311,53 @@ class MediaDownloader:
                     
                 if not self.config.getboolean('download', 'keep_video', fallback=True):
                     cmd.extend(['--keep-video'])
-            else:
+            elif format_spec is None:
                 if video_quality == 'best':
                     cmd.extend(['-f', 'best'])
                 elif video_quality == 'worst':
                     cmd.extend(['-f', 'worst'])
                 else:
                     cmd.extend(['-f', f'best[height<={video_quality[:-1]}]'])
+            if format_spec:
+                cmd.extend(['-f', format_spec])
+                merge_format = merge_output_format(format_spec, self.format_selector.video_target(options))
+                if merge_format:
+                    cmd.extend(['--merge-output-format', merge_format])
                     
+            # Merge and extract audio with the configured FFMPEG
+            ffmpeg_location = self._ffmpeg_location()
+            if ffmpeg_location:
+                cmd.extend(['--ffmpeg-location', ffmpeg_location])
+                
+                
             # Add subtitle options
             if self.config.getboolean('download', 'embed_subs', fallback=False):
                 cmd.extend(['--embed-subs', '--sub-langs', 'en,en-US'])
                 
             # Add other options
             cmd.extend(['--no-mtime'])  # Don't set file modification time
+            cmd.extend(['--continue', '--part'])  # Resume from .part files after a restart
             
+            # Fetch HLS/DASH fragments in parallel
+            host = parsed.netloc
+            concurrency = self.fragment_concurrency.get(host)
+            cmd.extend(['--concurrent-fragments', str(concurrency)])
+            
+            # Machine-readable progress, one JSON document per line
+            cmd.extend([
+                '--newline',
+                '--progress-template', f'download:{self.PROGRESS_PREFIX}%(progress)j'
+            ])
+            
+            if with_info:
+                # Print metadata and final file paths; --print implies quiet
+                # and simulate, so force the download and progress output back on
+                cmd.extend([
+                    '--no-simulate', '--progress',
+                    '--print', f'video:{self.INFO_PREFIX}%()j',
+                    '--print', f'after_move:{self.FILE_PREFIX}%(filepath)s'
+                ])
+                
             # Add custom options
             if options:
                 for key, value in options.items():
@@ -113,8 +366,12 @@ class MediaDownloader:
                     elif key == 'output':
                         cmd.extend(['-o', value])
                         
-            # Add URL
-            cmd.append(url)
+            # Add URL, or the cached info so yt-dlp skips extraction
+            if info is not None:
+                info_file = self._write_info_file(info)
+                cmd.extend(['--load-info-json', info_file])
+            else:
+                cmd.append(url)
             
             self.logger.info(f"Starting download: {' '.join(cmd)}")
             
@@ -130,23 +387,76 @@ class MediaDownloader:
             # Store process for potential cancellation
             process_id = id(process)
             self.active_processes[process_id] = process
+            download_id = self.bandwidth.acquire()
+            if cancel_event is not None:
+                threading.Thread(target=self._terminate_on_cancel, args=(process, cancel_event), daemon=True).start()
             
             try:
                 output_files = []
+                infos = []
+                last_lines = deque(maxlen=5)
+                
+                # Fragment statistics for adapting the concurrency
+                started = time.monotonic()
+                last_progress = None
+                received = 0
+                fragment_errors = 0
+                throttled = False
                 
                 # Monitor progress
                 for line in process.stdout:
                     line = line.strip()
                     if line:
+                        if line.startswith(self.PROGRESS_PREFIX):
+                            progress = self._parse_progress(line)
+                            if progress is not None:
+                                last_progress = progress
+                                if progress_callback:
+                                    progress_callback(progress)
+                                    
+                                # Hold the process back when it is over its share of the bandwidth
+                                downloaded = progress.downloaded_bytes or 0
+                                wait = self.bandwidth.consume(download_id, downloaded - received if downloaded >= received else downloaded)
+                                received = downloaded
+                                if wait > 0:
+                                    self._pause_process(process, download_id, wait)
+                            continue
+                        elif with_info and line.startswith(self.INFO_PREFIX):
+                            try:
+                                infos.append(json.loads(line[len(self.INFO_PREFIX):]))
+                            except json.JSONDecodeError as e:
+                                self.logger.warning(f"Failed to parse media information: {str(e)}")
+                            continue
+                        elif with_info and line.startswith(self.FILE_PREFIX):
+                            output_files.append(line[len(self.FILE_PREFIX):])
+                            continue
+                            
                         self.logger.debug(f"yt-dlp: {line}")
+                        last_lines.append(line)
                         
-                        # Parse progress information
+                        if self.FRAGMENT_RETRY in line:
+                            fragment_errors += 1
+                        # Only fragmented downloads open parallel connections; a 403
+                        # on a single-file download is a real error, not throttling
+                        fragmented = (self.FRAGMENT_RETRY in line
+                                      or (last_progress is not None and last_progress.fragment_count))
+                        if (self.THROTTLE_ERROR.search(line) and concurrency > 1 and fragmented
+                                and self.fragment_concurrency.adaptive()):
+                            # Restart with fewer connections; --continue keeps finished fragments
+                            throttled = True
+                            process.terminate()
+                            break
+                            
+                        # Parse progress from builds without --progress-template
                         if progress_callback:
                             progress = self._parse_progress(line)
                             if progress is not None:
                                 progress_callback(progress)
                                 
-                        # Extract output file information
+                        # Extract output file information (with_info mode gets
+                        # the final paths from the after_move print instead)
+                        if with_info:
+                            continue
                         if 'Destination:' in line:
                             filename = line.split('Destination:')[1].strip()
                             output_files.append(filename)
@@ -157,23 +467,45 @@ class MediaDownloader:
                             
                 # Wait for completion
                 return_code = process.wait()
-                
+                if cancel_event is not None and cancel_event.is_set():
+                    raise Exception("Download cancelled")
+                    
+                if throttled:
+                    lowered = self.fragment_concurrency.throttled(host, concurrency)
+                    self.logger.warning(f"{host} is throttling downloads, retrying with {lowered} concurrent fragment(s)")
+                    return self._download(url, options, progress_callback, with_info, info, cancel_event)
+                    
+                if return_code == 0 and last_progress is not None and last_progress.fragment_count:
+                    elapsed = time.monotonic() - started
+                    downloaded = last_progress.downloaded_bytes or last_progress.total_bytes or 0
+                    self.fragment_concurrency.record(
+                        host, concurrency, downloaded / elapsed if elapsed > 0 else 0,
+                        last_progress.fragment_count, fragment_errors
+                    )
+                    
                 if return_code == 0:
                     # Success
                     if progress_callback:
-                        progress_callback(100.0)
+                        progress_callback(DownloadProgress(status='finished', percent=100.0))
                         
-                    return {
+                    result = {
                         'success': True,
                         'output_files': output_files,
                         'message': 'Download completed successfully'
                     }
+                    if with_info:
+                        result['info'] = self._merge_infos(infos)
+                    return result
+                elif with_info and not infos:
+                    # yt-dlp failed before extraction finished
+                    raise Exception(f"URL not supported by yt-dlp: {' '.join(list(last_lines)[-2:])}")
                 else:
                     # Error
                     raise Exception(f"Download failed with return code {return_code}")
                     
             finally:
                 # Clean up process reference
+                self.bandwidth.release(download_id)
                 if process_id in self.active_processes:
                     del self.active_processes[process_id]
                     
@@ -182,9 +514,350 @@ class MediaDownloader:
         except Exception as e:
             self.logger.error(f"Download error: {str(e)}")
             raise
+        finally:
+            if info_file:
+                try:
+                    os.remove(info_file)
+                except OSError:
+                    pass
+                    
+    def _terminate_on_cancel(self, process, cancel_event):
+        """Stop a yt-dlp process once its download is cancelled"""
+        while process.poll() is None:
+            if cancel_event.wait(0.5):
+                process.terminate()
+                return
+                
+    def _can_split(self, format_spec, info, options=None):
+        """Check whether a video+audio format can be fetched as two concurrent downloads"""
+        if not format_spec or format_spec.count('+') != 1 or info is None:
+            return False
+        if self.ffmpeg is None or not self.can_merge():
+            return False
+        if options and 'output' in options:
+            return False  # The job names its own output file
+        if not self.config.getboolean('download', 'parallel_streams', fallback=True):
+            return False
+        format_ids = {fmt.get('format_id') for fmt in info.get('formats') or []}
+        return all(format_id in format_ids for format_id in format_spec.split('+'))
+        
+    def _download_split(self, url, options, format_spec, progress_callback=None, with_info=False, info=None):
+        """Download the video and audio formats concurrently, then join them by stream copy"""
+        format_ids = format_spec.split('+')
+        formats = {fmt.get('format_id'): fmt for fmt in info.get('formats') or []}
+        video_format, audio_format = (formats[format_id] for format_id in format_ids)
+        
+        download_dir = self.config.get('download', 'directory', 
+                                     fallback=os.path.expanduser('~/Downloads'))
+        os.makedirs(download_dir, exist_ok=True)
+        naming_pattern = self.config.get('output', 'naming_pattern', 
+                                       fallback='%(title)s.%(ext)s')
+        root, ext = os.path.splitext(naming_pattern)
+        
+        # The streams get a directory of their own, named after the media so an
+        # interrupted download resumes, and removed with their .part files
+        work_dir = os.path.join(download_dir, re.sub(r'[^\w.+-]', '_', f".streams_{info.get('id') or 'media'}_{format_spec}"))
+        stream_template = os.path.join(work_dir, f"{root}.f%(format_id)s{ext or '.%(ext)s'}")
+        
+        # Combined progress: bytes across both streams, using the format's
+        # size estimate until yt-dlp reports a total; the join takes the last 5%
+        duration = info.get('duration')
+        progress_lock = threading.Lock()
+        streams = {
+            format_id: {
+                'downloaded': 0,
+                'total': self.format_selector.estimated_size(formats[format_id], duration),
+                'speed': None
+            }
+            for format_id in format_ids
+        }
+        
+        def stream_progress(format_id):
+            def callback(progress):
+                if not progress_callback:
+                    return
+                with progress_lock:
+                    stream = streams[format_id]
+                    if progress.status == 'finished':
+                        if stream['total'] == float('inf'):
+                            stream['total'] = max(stream['downloaded'], 1)
+                        stream['downloaded'] = stream['total']
+                        stream['speed'] = None
+                    else:
+                        if progress.total_bytes:
+                            stream['total'] = progress.total_bytes
+                        if progress.downloaded_bytes is not None:
+                            stream['downloaded'] = progress.downloaded_bytes
+                        elif progress.percent is not None and stream['total'] != float('inf'):
+                            stream['downloaded'] = stream['total'] * progress.percent / 100
+                        stream['speed'] = progress.speed
+                        
+                    totals = [stream['total'] for stream in streams.values()]
+                    downloaded = sum(stream['downloaded'] for stream in streams.values())
+                    if float('inf') in totals:
+                        # Unknown sizes count each stream equally
+                        percent = sum(
+                            min(stream['downloaded'] / stream['total'], 1.0) if stream['total'] != float('inf') else 0.0
+                            for stream in streams.values()
+                        ) * 50
+                        total = None
+                    else:
+                        total = sum(totals)
+                        percent = min(downloaded * 100.0 / total, 100.0) if total else 0.0
+                    speeds = [stream['speed'] for stream in streams.values() if stream['speed']]
+                    speed = sum(speeds) if speeds else None
+                    eta = (total - downloaded) / speed if total and speed else None
+                    
+                progress_callback(DownloadProgress(
+                    downloaded_bytes=downloaded, total_bytes=total, speed=speed, eta=eta, percent=percent * 0.95
+                ))
+            return callback
+            
+        self.logger.info(f"Downloading video format {format_ids[0]} and audio format {format_ids[1]} concurrently")
+        cancel_event = threading.Event()
+        try:
+            with ThreadPoolExecutor(max_workers=2, thread_name_prefix='stream') as executor:
+                futures = [
+                    executor.submit(
+                        self._download, url, {'format': format_id, 'output': stream_template},
+                        stream_progress(format_id), with_info and index == 0, info, cancel_event
+                    )
+                    for index, format_id in enumerate(format_ids)
+                ]
+                
+                # A failed stream stops the other instead of waiting for it to finish
+                done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+                failed = next((future for future in done if future.exception()), None)
+                if failed is not None:
+                    cancel_event.set()
+                    raise failed.exception()
+                results = [future.result() for future in futures]
+                
+            stream_files = []
+            for format_id, result in zip(format_ids, results):
+                if not result['output_files']:
+                    raise Exception(f"No file was downloaded for format {format_id}")
+                stream_files.append(result['output_files'][0])
+                
+            # Join into the job's target container when it can hold both codecs as they are
+            container = merge_container(
+                codec_name(video_format.get('vcodec')),
+                codec_name(audio_format.get('acodec')) or self.format_selector.audio_codec(audio_format),
+                self.format_selector.video_target(options)
+            )
+            video_file = stream_files[0]
+            suffix = f".f{format_ids[0]}{os.path.splitext(video_file)[1]}"
+            base = video_file[:-len(suffix)] if video_file.endswith(suffix) else os.path.splitext(video_file)[0]
+            output_file = os.path.join(download_dir, f"{os.path.relpath(base, work_dir)}.{container}")
+            os.makedirs(os.path.dirname(output_file), exist_ok=True)
+            
+            def mux_progress(progress, *_):
+                if progress_callback and progress is not None:
+                    progress_callback(DownloadProgress(status='merging', percent=95 + progress * 0.05))
+                    
+            try:
+                self.ffmpeg.mux_streams(stream_files[0], stream_files[1], output_file, mux_progress)
+            except Exception:
+                if os.path.exists(output_file):
+                    os.remove(output_file)
+                raise
+                
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            
+        if progress_callback:
+            progress_callback(DownloadProgress(status='finished', percent=100.0))
+            
+        result = {
+            'success': True,
+            'output_files': [output_file],
+            'message': 'Download completed successfully'
+        }
+        if with_info:
+            result['info'] = results[0].get('info') or info
+        return result
+        
+    def _pause_process(self, process, download_id, wait):
+        """Suspend a yt-dlp process until it has paid off its bandwidth debt"""
+        if not hasattr(signal, 'SIGSTOP'):
+            # No job control (Windows): not reading its output stalls it once the pipe fills
+            self.bandwidth.wait(download_id, wait)
+            return
+            
+        process.send_signal(signal.SIGSTOP)
+        try:
+            self.bandwidth.wait(download_id, wait)
+        finally:
+            if process.poll() is None:
+                process.send_signal(signal.SIGCONT)
+                
+    def _download_with_engine(self, url, options=None, progress_callback=None, with_info=False, info=None, format_spec=None,
+                              cancel_event=None):
+        """Download media through the in-process yt-dlp engine"""
+        self.logger.info(f"Starting download: {url}")
+        
+        host = urlparse(url).netloc
+        concurrency = self.fragment_concurrency.get(host)
+        ydl_opts = self._build_ydl_opts(options, format_spec)
+        ydl_opts['concurrent_fragment_downloads'] = concurrency
+        
+        # Progress hooks run on the downloading thread, so sleeping there
+        # keeps the download within its share of the bandwidth
+        download_id = self.bandwidth.acquire()
+        received = 0
+        fragmented = False
+        
+        def governed_progress(progress):
+            nonlocal received, fragmented
+            fragmented = fragmented or bool(progress.fragment_count)
+            downloaded = progress.downloaded_bytes or 0
+            self.bandwidth.throttle(download_id, downloaded - received if downloaded >= received else downloaded)
+            received = downloaded
+            if progress_callback:
+                progress_callback(progress)
+                
+        try:
+            info, output_files = self.engine.download(url, ydl_opts, governed_progress, info, cancel_event)
+        except Exception as e:
+            # The next download from this host starts with fewer connections
+            if fragmented and self.THROTTLE_ERROR.search(str(e)):
+                self.fragment_concurrency.throttled(host, concurrency)
+            raise Exception(f"Download failed: {str(e)}")
+        finally:
+            self.bandwidth.release(download_id)
+            
+        if progress_callback:
+            progress_callback(DownloadProgress(status='finished', percent=100.0))
+            
+        result = {
+            'success': True,
+            'output_files': output_files,
+            'message': 'Download completed successfully'
+        }
+        if with_info:
+            result['info'] = info
+        return result
+        
+    def _build_ydl_opts(self, options=None, format_spec=None):
+        """Build YoutubeDL options equivalent to the yt-dlp command line"""
+        download_dir = self.config.get('download', 'directory', 
+                                     fallback=os.path.expanduser('~/Downloads'))
+        os.makedirs(download_dir, exist_ok=True)
+        
+        naming_pattern = self.config.get('output', 'naming_pattern', 
+                                       fallback='%(title)s.%(ext)s')
+        ydl_opts = {
+            'outtmpl': os.path.join(download_dir, naming_pattern),
+            'updatetime': False,
+            'continuedl': True,  # Resume from .part files after a restart
+            'nopart': False,
+            'postprocessors': []
+        }
+        
+        # Quality settings
+        video_quality = self.config.get('download', 'video_quality', fallback='best')
+        if self.config.getboolean('download', 'extract_audio', fallback=False):
+            ydl_opts['format'] = format_spec or 'bestaudio/best'
+            extract_audio = {
+                'key': 'FFmpegExtractAudio',
+                'preferredcodec': self.config.get('output', 'audio_format', fallback='mp3')
+            }
+            audio_quality = self.config.get('download', 'audio_quality', fallback='best')
+            if audio_quality != 'best' and audio_quality != 'worst':
+                extract_audio['preferredquality'] = audio_quality
+            ydl_opts['postprocessors'].append(extract_audio)
+            ydl_opts['keepvideo'] = self.config.getboolean('download', 'keep_video', fallback=True)
+        elif format_spec:
+            ydl_opts['format'] = format_spec
+            merge_format = merge_output_format(format_spec, self.format_selector.video_target(options))
+            if merge_format:
+                ydl_opts['merge_output_format'] = merge_format
+        elif video_quality in ('best', 'worst'):
+            ydl_opts['format'] = video_quality
+        else:
+            ydl_opts['format'] = f'best[height<={video_quality[:-1]}]'
+            
+        ffmpeg_location = self._ffmpeg_location()
+        if ffmpeg_location:
+            ydl_opts['ffmpeg_location'] = ffmpeg_location
+            
+        # Subtitle options
+        if self.config.getboolean('download', 'embed_subs', fallback=False):
+            ydl_opts['writesubtitles'] = True
+            ydl_opts['subtitleslangs'] = ['en', 'en-US']
+            ydl_opts['postprocessors'].append({'key': 'FFmpegEmbedSubtitle'})
+            
+        # Custom options
+        if options:
+            if 'format' in options:
+                ydl_opts['format'] = options['format']
+            if 'output' in options:
+                ydl_opts['outtmpl'] = options['output']
+                
+        return ydl_opts
+        
+    def _ffmpeg_location(self):
+        """Full path of the configured FFMPEG binary, or None if it can't be found"""
+        return shutil.which(self.config.get('processing', 'ffmpeg_path', fallback='ffmpeg'))
+        
+    def get_cached_info(self, url):
+        """Get media information from the metadata cache, if present"""
+        if not self.metadata_cache:
+            return None
+            
+        try:
+            return self.metadata_cache.get(url)
+        except Exception as e:
+            self.logger.warning(f"Metadata cache lookup failed: {str(e)}")
+            return None
+            
+    def _cache_info(self, url, info):
+        """Store single-video media information in the metadata cache"""
+        if not self.metadata_cache or not info:
+            return
+            
+        # Playlist entries expire independently and can't be replayed as one info file
+        if info.get('_type', 'video') != 'video' or not info.get('formats'):
+            return
             
+        try:
+            self.metadata_cache.put(url, info)
+        except Exception as e:
+            self.logger.warning(f"Could not cache media info: {str(e)}")
+            
+    def _write_info_file(self, info):
+        """Write media information to a temporary file for --load-info-json"""
+        fd, info_file = tempfile.mkstemp(suffix='.info.json', prefix='media_processor_')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(info, f)
+        return info_file
+        
+    def _merge_infos(self, infos):
+        """Combine per-entry metadata printed by yt-dlp into a single info dict"""
+        if not infos:
+            return {}
+        if len(infos) == 1:
+            return infos[0]
+            
+        # Playlist: one JSON document per downloaded entry
+        first = infos[0]
+        return {
+            '_type': 'playlist',
+            'title': first.get('playlist_title') or first.get('playlist') or first.get('title'),
+            'id': first.get('playlist_id'),
+            'duration': sum(info.get('duration') or 0 for info in infos),
+            'entries': infos
+        }
+        
     def _parse_progress(self, line):
-        """Parse progress from yt-dlp output"""
+        """Parse a progress event from yt-dlp output"""
+        if line.startswith(self.PROGRESS_PREFIX):
+            try:
+                progress = json.loads(line[len(self.PROGRESS_PREFIX):])
+            except json.JSONDecodeError:
+                return None
+            return DownloadProgress.from_dict(progress) if isinstance(progress, dict) else None
+            
         try:
             if '[download]' in line and '%' in line:
                 # Look for percentage in the line
@@ -193,7 +866,7 @@ class MediaDownloader:
                     if part.endswith('%'):
                         # Remove % and convert to float
                         percent_str = part[:-1]
-                        return float(percent_str)
+                        return DownloadProgress(percent=float(percent_str))
                         
         except (ValueError, IndexError):
             pass
@@ -214,5 +887,9 @@ class MediaDownloader:
                 
     def cleanup(self):
         """Cleanup all active downloads"""
+        if self.engine:
+            self.engine.shutdown()
+        if self.metadata_cache:
+            self.metadata_cache.close()
         for process_id in list(self.active_processes.keys()):
             self.cancel_download(process_id)
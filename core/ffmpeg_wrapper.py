@@ -5,18 +5,110 @@ FFMPEG wrapper for media processing
 import os
 import subprocess
 import json
-import re
+import csv
+import shutil
+import tempfile
 import threading
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+from core.probe_cache import ProbeCache
+from core.progress import FFmpegProgress
+from core.thread_budget import ThreadBudget
+
+# Marks a container that accepts any codec for a stream type
+ANY_CODEC = None
+
+# Source codecs each output container can hold without re-encoding
+CONTAINER_CODECS = {
+    'mp4': {
+        'video': {'h264', 'hevc', 'av1', 'vp9', 'mpeg4', 'mpeg2video'},
+        'audio': {'aac', 'mp3', 'ac3', 'eac3', 'opus', 'flac', 'alac'}
+    },
+    'mov': {
+        'video': {'h264', 'hevc', 'mpeg4', 'prores', 'mjpeg'},
+        'audio': {'aac', 'mp3', 'alac', 'ac3', 'pcm_s16le', 'pcm_s24le'}
+    },
+    'mkv': {'video': ANY_CODEC, 'audio': ANY_CODEC},
+    'webm': {'video': {'vp8', 'vp9', 'av1'}, 'audio': {'opus', 'vorbis'}},
+    'avi': {
+        'video': {'h264', 'mpeg4', 'mjpeg', 'msmpeg4v2', 'msmpeg4v3'},
+        'audio': {'mp3', 'ac3', 'pcm_s16le'}
+    },
+    'mp3': {'audio': {'mp3'}},
+    'aac': {'audio': {'aac'}},
+    'm4a': {'audio': {'aac', 'alac'}},
+    'flac': {'audio': {'flac'}},
+    'wav': {'audio': {'pcm_s16le', 'pcm_s24le', 'pcm_s32le', 'pcm_f32le', 'pcm_u8'}},
+    'ogg': {'audio': {'vorbis', 'opus', 'flac'}},
+    'opus': {'audio': {'opus'}}
+}
+
+# Subtitle codec each container stores; text subtitles are converted to it
+CONTAINER_SUBTITLES = {'mkv': ANY_CODEC, 'mp4': 'mov_text', 'mov': 'mov_text', 'webm': 'webvtt'}
+
+# Subtitle codecs stored as text, which can be converted between containers
+TEXT_SUBTITLE_CODECS = {'subrip', 'srt', 'ass', 'ssa', 'webvtt', 'mov_text', 'text'}
+
+# Encoders used when a stream has to be re-encoded
+DEFAULT_ENCODERS = {
+    'mp4': {'video': 'libx264', 'audio': 'aac'},
+    'mov': {'video': 'libx264', 'audio': 'aac'},
+    'mkv': {'video': 'libx264', 'audio': 'aac'},
+    'webm': {'video': 'libvpx-vp9', 'audio': 'libopus'},
+    'mp3': {'audio': 'libmp3lame'},
+    'aac': {'audio': 'aac'},
+    'm4a': {'audio': 'aac'},
+    'flac': {'audio': 'flac'},
+    'wav': {'audio': 'pcm_s16le'},
+    'ogg': {'audio': 'libvorbis'},
+    'opus': {'audio': 'libopus'}
+}
+
+# Encoders that reproduce a source audio codec when a merge input has to be
+# normalized. Their decoder configuration depends only on the profile, sample
+# rate and channel count, so their output can be stream copied alongside the
+# other inputs; re-encoded video would carry its own encoder's parameter sets
+CODEC_ENCODERS = {'aac': 'aac', 'mp3': 'libmp3lame', 'ac3': 'ac3', 'pcm_s16le': 'pcm_s16le'}
+
+# Encoder arguments reproducing a source profile, for codecs with several
+CODEC_PROFILES = {'aac': {'LC': ['-profile:a', 'aac_low']}}
+
+# Containers whose muxer can set the video time base while stream copying
+TIMESCALE_CONTAINERS = ('mp4', 'mov', 'm4v')
+
+# Options that can only be applied by re-encoding a stream type
+REENCODE_OPTIONS = {
+    'video': ('video_bitrate', 'resolution', 'framerate', 'filters'),
+    'audio': ('audio_bitrate', 'sample_rate')
+}
+
 class FFMPEGWrapper:
     """Wrapper for FFMPEG operations"""
     
+    # Lines of stderr kept for error messages
+    STDERR_TAIL_LINES = 50
+    
     def __init__(self, config, logger):
         self.config = config
         self.logger = logger
         self.active_processes = {}
         
+        # ffprobe results, optionally persisted across runs
+        db_path = None
+        if self.config.getboolean('advanced', 'persistent_probe_cache', fallback=True):
+            db_path = Path.home() / '.media_processor' / 'probe_cache.db'
+        try:
+            self.probe_cache = ProbeCache(db_path=db_path)
+        except Exception as e:
+            self.logger.warning(f"Could not open probe cache: {str(e)}")
+            self.probe_cache = ProbeCache()
+            
+        # CPU threads shared between all FFMPEG processes started by this wrapper
+        cpu_threads = self.config.getint('processing', 'cpu_threads', fallback=0)
+        self.thread_budget = ThreadBudget(cpu_threads or None)
+        
     def get_ffmpeg_path(self):
         """Get FFMPEG executable path"""
         ffmpeg_path = self.config.get('processing', 'ffmpeg_path', fallback='ffmpeg')
@@ -32,7 +124,24 @@ class FFMPEGWrapper:
             return False
             
     def get_media_info(self, file_path):
-        """Get media file information using ffprobe"""
+        """Get media file information using ffprobe, cached per file version"""
+        try:
+            key = ProbeCache.make_key(file_path)
+        except OSError:
+            key = None
+            
+        if key is not None:
+            info = self.probe_cache.get(key)
+            if info is not None:
+                return info
+                
+        info = self._probe(file_path)
+        if key is not None:
+            self.probe_cache.put(key, info)
+        return info
+        
+    def _probe(self, file_path):
+        """Run ffprobe on a file"""
         try:
             ffprobe_path = self.get_ffmpeg_path().replace('ffmpeg', 'ffprobe')
             
@@ -60,7 +169,65 @@ class FFMPEGWrapper:
             self.logger.error(f"Error getting media info: {str(e)}")
             raise
             
-    def convert_video(self, input_file, output_file, options=None, progress_callback=None):
+    def plan_codecs(self, media_info, output_file, options=None):
+        """Choose a codec per stream type: 'copy' when the target container
+        supports the source codec and nothing forces a re-encode"""
+        options = options or {}
+        container = Path(output_file).suffix[1:].lower()
+        supported = CONTAINER_CODECS.get(container, {})
+        encoders = DEFAULT_ENCODERS.get(container, {})
+        streams = (media_info or {}).get('streams', [])
+        
+        plan = {}
+        notes = []
+        for kind in ('video', 'audio'):
+            source = self._first_stream(streams, kind)
+            source_codec = source.get('codec_name', 'unknown') if source else None
+            requested = options.get(f'{kind}_codec')
+            if requested:
+                plan[kind] = requested
+                notes.append(f"{kind} {requested} (requested)")
+            elif source is None or container not in CONTAINER_CODECS:
+                # Unknown source or container, let FFMPEG decide as before
+                plan[kind] = encoders.get(kind)
+                notes.append(f"{kind} {plan[kind] or 'default encoder'}")
+            elif kind not in supported:
+                # e.g. video stream into an audio-only container
+                plan[kind] = None
+                notes.append(f"{kind} dropped")
+            elif any(key in options for key in REENCODE_OPTIONS[kind]):
+                plan[kind] = encoders.get(kind)
+                notes.append(f"{kind} re-encode {source_codec} -> {plan[kind] or 'default encoder'} (options)")
+            elif supported[kind] is ANY_CODEC or source_codec in supported[kind]:
+                plan[kind] = 'copy'
+                notes.append(f"{kind} stream copy ({source_codec})")
+            else:
+                plan[kind] = encoders.get(kind)
+                notes.append(f"{kind} re-encode {source_codec} -> {plan[kind] or 'default encoder'}")
+                
+        self.logger.info(f"Codec plan for {os.path.basename(output_file)}: {', '.join(notes)}")
+        return plan
+        
+    def _first_stream(self, streams, kind):
+        """First stream of a type, ignoring embedded cover art"""
+        for stream in streams:
+            if stream.get('codec_type') != kind:
+                continue
+            if stream.get('disposition', {}).get('attached_pic'):
+                continue
+            return stream
+        return None
+        
+    def _media_info_for_plan(self, input_file, media_info):
+        """Probe the input if the caller didn't, for codec planning"""
+        if media_info is not None:
+            return media_info
+        try:
+            return self.get_media_info(input_file)
+        except Exception:
+            return None
+            
+    def convert_video(self, input_file, output_file, options=None, progress_callback=None, media_info=None):
         """Convert video file"""
         try:
             cmd = [self.get_ffmpeg_path()]
@@ -68,16 +235,21 @@ class FFMPEGWrapper:
             # Input file
             cmd.extend(['-i', input_file])
             
+            # Copy streams the target container supports, re-encode the rest
+            media_info = self._media_info_for_plan(input_file, media_info)
+            plan = self.plan_codecs(media_info, output_file, options)
+            
+            # Long re-encodes are split into chunks encoded in parallel
+            if self._should_encode_chunked(media_info, plan, options):
+                return self._convert_chunked(input_file, output_file, plan, options, media_info, progress_callback)
+                
+            if plan['video']:
+                cmd.extend(['-c:v', plan['video']])
+            if plan['audio']:
+                cmd.extend(['-c:a', plan['audio']])
+                
             # Add conversion options
             if options:
-                # Video codec
-                if 'video_codec' in options:
-                    cmd.extend(['-c:v', options['video_codec']])
-                    
-                # Audio codec
-                if 'audio_codec' in options:
-                    cmd.extend(['-c:a', options['audio_codec']])
-                    
                 # Video bitrate
                 if 'video_bitrate' in options:
                     cmd.extend(['-b:v', options['video_bitrate']])
@@ -98,26 +270,181 @@ class FFMPEGWrapper:
                 if 'filters' in options:
                     cmd.extend(['-vf', options['filters']])
                     
-            else:
-                # Default conversion settings
-                video_format = self.config.get('output', 'video_format', fallback='mp4')
-                if video_format == 'mp4':
-                    cmd.extend(['-c:v', 'libx264', '-c:a', 'aac'])
-                elif video_format == 'mkv':
-                    cmd.extend(['-c:v', 'libx264', '-c:a', 'aac'])
-                elif video_format == 'webm':
-                    cmd.extend(['-c:v', 'libvpx-vp9', '-c:a', 'libopus'])
-                    
+            # Audio-only targets drop the video stream
+            if 'video' not in CONTAINER_CODECS.get(Path(output_file).suffix[1:].lower(), {'video': ANY_CODEC}):
+                cmd.extend(['-vn'])
+                
             # Output file
             cmd.extend(['-y', output_file])  # -y to overwrite
             
-            return self._run_ffmpeg_process(cmd, progress_callback, input_file)
+            return self._run_ffmpeg_process(cmd, progress_callback, input_file, media_info)
             
         except Exception as e:
             self.logger.error(f"Video conversion error: {str(e)}")
             raise
             
-    def extract_audio(self, input_file, output_file, options=None, progress_callback=None):
+    def _should_encode_chunked(self, media_info, plan, options):
+        """Check whether a conversion qualifies for segment-parallel encoding"""
+        threshold = self.config.getint('processing', 'chunked_encoding_threshold', fallback=1800)
+        if not threshold or plan.get('video') in (None, 'copy'):
+            return False
+            
+        # Audio files, including ones with cover art, have no video to split
+        if self._first_stream((media_info or {}).get('streams', []), 'video') is None:
+            return False
+            
+        # Filters may depend on timestamps, which restart in every chunk
+        if options and 'filters' in options:
+            return False
+            
+        try:
+            duration = float(media_info['format']['duration'])
+        except (TypeError, KeyError, ValueError):
+            return False
+            
+        return duration >= threshold
+        
+    def _convert_chunked(self, input_file, output_file, plan, options, media_info, progress_callback=None):
+        """Encode the video stream in keyframe-aligned chunks across a pool of FFMPEG processes,
+        then concatenate the chunks losslessly and mux the audio back in"""
+        options = options or {}
+        chunk_duration = self.config.getint('processing', 'chunk_duration', fallback=120)
+        max_workers = self.config.getint('processing', 'chunk_workers', fallback=0)
+        if not max_workers:
+            max_workers = max(2, (os.cpu_count() or 2) // 2)
+            
+        work_dir = tempfile.mkdtemp(prefix='.chunks_', dir=os.path.dirname(os.path.abspath(output_file)))
+        
+        # Progress: splitting 5%, encoding 85%, concatenation 10%
+        def report(progress, details=None):
+            if progress_callback:
+                progress_callback(None if progress is None else min(progress, 100.0), details)
+                
+        try:
+            # Split the video stream at keyframes without re-encoding; the
+            # segment list records each chunk's duration for progress
+            segment_list = os.path.join(work_dir, 'segments.csv')
+            split_cmd = [
+                self.get_ffmpeg_path(), '-i', input_file,
+                '-map', '0:v:0', '-c', 'copy',
+                '-f', 'segment', '-segment_time', str(chunk_duration), '-reset_timestamps', '1',
+                '-segment_list', segment_list, '-segment_list_type', 'csv',
+                os.path.join(work_dir, 'source_%05d.mkv')
+            ]
+            self._run_ffmpeg_process(split_cmd, self._stage_progress(report, 0, 5), input_file, media_info)
+            
+            chunks = sorted(name for name in os.listdir(work_dir) if name.startswith('source_'))
+            if not chunks:
+                raise Exception("Splitting produced no chunks")
+            durations = self._segment_durations(segment_list)
+            
+            self.logger.info(f"Encoding {len(chunks)} chunks with {max_workers} workers")
+            
+            # Encode chunks concurrently, each in its own FFMPEG process
+            chunk_progress = [0.0] * len(chunks)
+            progress_lock = threading.Lock()
+            
+            def encode_chunk(index, name):
+                source = os.path.join(work_dir, name)
+                encoded = os.path.join(work_dir, f"encoded_{index:05d}.mkv")
+                cmd = [self.get_ffmpeg_path(), '-i', source, '-map', '0:v:0', '-c:v', plan['video']]
+                cmd.extend(self._video_option_args(options))
+                cmd.extend(['-an', '-y', encoded])
+                
+                def chunk_callback(progress, details=None):
+                    with progress_lock:
+                        if progress is not None:
+                            chunk_progress[index] = progress
+                        total = sum(chunk_progress) / len(chunk_progress)
+                    report(5 + total * 0.85, details)
+                    
+                # Chunks are temporary, so they are not probed (or cached) for their duration
+                chunk_info = {'format': {'duration': str(durations.get(name, chunk_duration))}}
+                self._run_ffmpeg_process(cmd, chunk_callback, source, chunk_info,
+                                         parallel_jobs=min(max_workers, len(chunks)))
+                return encoded
+                
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [executor.submit(encode_chunk, i, name) for i, name in enumerate(chunks)]
+                try:
+                    encoded_chunks = [future.result() for future in futures]
+                except Exception:
+                    for future in futures:
+                        future.cancel()
+                    raise
+                    
+            # Concatenate the encoded chunks and mux every audio track, and the
+            # subtitles the container can hold, from the original
+            list_file = os.path.join(work_dir, 'chunks.txt')
+            self._write_concat_list(list_file, encoded_chunks)
+            
+            concat_cmd = [
+                self.get_ffmpeg_path(),
+                '-f', 'concat', '-safe', '0', '-i', list_file,
+                '-i', input_file,
+                '-map', '0:v:0', '-map', '1:a?',
+                '-c:v', 'copy'
+            ]
+            concat_cmd.extend(self._subtitle_args(media_info, output_file, 1))
+            if plan['audio']:
+                concat_cmd.extend(['-c:a', plan['audio']])
+            if 'audio_bitrate' in options:
+                concat_cmd.extend(['-b:a', options['audio_bitrate']])
+            concat_cmd.extend(['-y', output_file])
+            
+            result = self._run_ffmpeg_process(concat_cmd, self._stage_progress(report, 90, 10), input_file, media_info)
+            report(100.0)
+            return result
+            
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            
+    def _segment_durations(self, segment_list):
+        """Chunk durations by file name, from a segment muxer CSV list"""
+        durations = {}
+        try:
+            with open(segment_list, newline='', encoding='utf-8') as f:
+                for row in csv.reader(f):
+                    if len(row) >= 3:
+                        durations[os.path.basename(row[0])] = float(row[2]) - float(row[1])
+        except (OSError, ValueError):
+            pass
+        return durations
+        
+    def _subtitle_args(self, media_info, output_file, input_index):
+        """FFMPEG arguments carrying an input's subtitle streams into the output, where
+        the container can hold them; bitmap subtitles can't be converted to text"""
+        container = Path(output_file).suffix[1:].lower()
+        if container not in CONTAINER_SUBTITLES:
+            return []
+        codec = CONTAINER_SUBTITLES[container]
+        subtitles = [stream for stream in (media_info or {}).get('streams', []) if stream.get('codec_type') == 'subtitle']
+        
+        args = []
+        kept = set()
+        for index, stream in enumerate(subtitles):
+            name = stream.get('codec_name')
+            if codec is ANY_CODEC or name in TEXT_SUBTITLE_CODECS:
+                args.extend(['-map', f'{input_index}:s:{index}'])
+                kept.add(name)
+            else:
+                self.logger.warning(f"Dropping {name} subtitles, which {container} can't hold")
+        if args:
+            args.extend(['-c:s', 'copy' if codec is ANY_CODEC or kept == {codec} else codec])
+        return args
+        
+    def _video_option_args(self, options):
+        """FFMPEG arguments for the video encoding options of a job"""
+        args = []
+        if 'video_bitrate' in options:
+            args.extend(['-b:v', options['video_bitrate']])
+        if 'resolution' in options:
+            args.extend(['-s', options['resolution']])
+        if 'framerate' in options:
+            args.extend(['-r', str(options['framerate'])])
+        return args
+        
+    def extract_audio(self, input_file, output_file, options=None, progress_callback=None, media_info=None):
         """Extract audio from video file"""
         try:
             cmd = [self.get_ffmpeg_path()]
@@ -125,25 +452,18 @@ class FFMPEGWrapper:
             # Input file
             cmd.extend(['-i', input_file])
             
+            # Copy the audio stream if the target container supports it
+            media_info = self._media_info_for_plan(input_file, media_info)
+            plan = self.plan_codecs(media_info, output_file, options)
+            if plan['audio']:
+                cmd.extend(['-c:a', plan['audio']])
+                
             # Audio extraction options
             if options:
-                if 'audio_codec' in options:
-                    cmd.extend(['-c:a', options['audio_codec']])
                 if 'audio_bitrate' in options:
                     cmd.extend(['-b:a', options['audio_bitrate']])
                 if 'sample_rate' in options:
                     cmd.extend(['-ar', str(options['sample_rate'])])
-            else:
-                # Default audio settings
-                audio_format = self.config.get('output', 'audio_format', fallback='mp3')
-                if audio_format == 'mp3':
-                    cmd.extend(['-c:a', 'libmp3lame'])
-                elif audio_format == 'aac':
-                    cmd.extend(['-c:a', 'aac'])
-                elif audio_format == 'flac':
-                    cmd.extend(['-c:a', 'flac'])
-                elif audio_format == 'wav':
-                    cmd.extend(['-c:a', 'pcm_s16le'])
                     
             # No video
             cmd.extend(['-vn'])
@@ -151,46 +471,336 @@ class FFMPEGWrapper:
             # Output file
             cmd.extend(['-y', output_file])
             
-            return self._run_ffmpeg_process(cmd, progress_callback, input_file)
+            return self._run_ffmpeg_process(cmd, progress_callback, input_file, media_info)
             
         except Exception as e:
             self.logger.error(f"Audio extraction error: {str(e)}")
             raise
             
-    def merge_files(self, input_files, output_file, progress_callback=None):
-        """Merge multiple media files"""
+    def transcode_outputs(self, input_file, targets, progress_callback=None, media_info=None):
+        """Produce several outputs from one FFMPEG process, so the input is
+        demuxed and decoded once; targets is a list of (output_file, options)"""
         try:
             cmd = [self.get_ffmpeg_path()]
             
-            # Add input files
-            for input_file in input_files:
-                cmd.extend(['-i', input_file])
+            # Input file
+            cmd.extend(['-i', input_file])
+            
+            media_info = self._media_info_for_plan(input_file, media_info)
+            output_indices = []
+            for output_file, options in targets:
+                options = options or {}
+                
+                # Each output gets its own codec plan; decoded streams are shared
+                plan = self.plan_codecs(media_info, output_file, options)
+                if plan['video']:
+                    cmd.extend(['-c:v', plan['video']])
+                if plan['audio']:
+                    cmd.extend(['-c:a', plan['audio']])
+                    
+                cmd.extend(self._video_option_args(options))
+                if 'audio_bitrate' in options:
+                    cmd.extend(['-b:a', options['audio_bitrate']])
+                if 'sample_rate' in options:
+                    cmd.extend(['-ar', str(options['sample_rate'])])
+                if 'filters' in options:
+                    cmd.extend(['-vf', options['filters']])
+                    
+                # Audio-only targets drop the video stream
+                if 'video' not in CONTAINER_CODECS.get(Path(output_file).suffix[1:].lower(), {'video': ANY_CODEC}):
+                    cmd.extend(['-vn'])
+                    
+                cmd.append('-y')
+                output_indices.append(len(cmd))
+                cmd.append(output_file)
                 
-            # Filter complex for concatenation
-            filter_inputs = ''.join([f'[{i}:v][{i}:a]' for i in range(len(input_files))])
-            filter_concat = f'{filter_inputs}concat=n={len(input_files)}:v=1:a=1[outv][outa]'
-            cmd.extend(['-filter_complex', filter_concat])
-            cmd.extend(['-map', '[outv]', '-map', '[outa]'])
+            result = self._run_ffmpeg_process(cmd, progress_callback, input_file, media_info, output_indices)
+            result['output_files'] = [output_file for output_file, _ in targets]
+            return result
             
-            # Output file
-            cmd.extend(['-y', output_file])
+        except Exception as e:
+            self.logger.error(f"Multi-output transcode error: {str(e)}")
+            raise
             
-            return self._run_ffmpeg_process(cmd, progress_callback)
+    def mux_streams(self, video_file, audio_file, output_file, progress_callback=None):
+        """Join a separately downloaded video and audio stream by stream copy"""
+        try:
+            cmd = [
+                self.get_ffmpeg_path(),
+                '-i', video_file,
+                '-i', audio_file,
+                '-map', '0:v:0', '-map', '1:a:0',
+                '-c', 'copy',
+                '-y', output_file
+            ]
+            return self._run_ffmpeg_process(cmd, progress_callback, video_file)
+            
+        except Exception as e:
+            self.logger.error(f"Stream mux error: {str(e)}")
+            raise
+            
+    def merge_files(self, input_files, output_file, progress_callback=None):
+        """Merge multiple media files, by stream copy when their codec parameters allow"""
+        try:
+            infos = [self.get_media_info(input_file) for input_file in input_files]
+            signatures = [self._merge_signature(info) for info in infos]
+            
+            # The most common parameters win; only inputs that differ get normalized
+            reference = Counter(signatures).most_common(1)[0][0]
+            if self._can_concat_copy(reference, output_file):
+                mismatched = [i for i, signature in enumerate(signatures) if signature != reference]
+                if not mismatched:
+                    self.logger.info(f"Merging {len(input_files)} compatible files by stream copy")
+                    return self._concat_copy(input_files, output_file, infos, progress_callback)
+                    
+                if self._can_normalize(signatures, reference, mismatched, output_file):
+                    self.logger.info(f"Normalizing {len(mismatched)} of {len(input_files)} files before merging by stream copy")
+                    return self._concat_normalized(input_files, output_file, infos, signatures,
+                                                   reference, mismatched, progress_callback)
+                                                   
+            self.logger.info(f"Merging {len(input_files)} files with the concat filter")
+            return self._concat_filter(input_files, output_file, infos, signatures, progress_callback)
             
         except Exception as e:
             self.logger.error(f"File merge error: {str(e)}")
             raise
             
-    def _run_ffmpeg_process(self, cmd, progress_callback=None, input_file=None):
-        """Run FFMPEG process with progress monitoring"""
+    def _merge_signature(self, media_info):
+        """Stream parameters that must match for the concat demuxer, as (video, audio)"""
+        streams = media_info.get('streams', [])
+        video = self._first_stream(streams, 'video')
+        audio = self._first_stream(streams, 'audio')
+        if video is None and audio is None:
+            raise Exception(f"No audio or video streams in {media_info.get('format', {}).get('filename', 'input')}")
+            
+        if video is not None:
+            video = (video.get('codec_name'), video.get('width'), video.get('height'),
+                     video.get('pix_fmt'), video.get('r_frame_rate'),
+                     video.get('profile'), video.get('level'), video.get('time_base'))
+        if audio is not None:
+            audio = (audio.get('codec_name'), audio.get('sample_rate'), audio.get('channels'),
+                     audio.get('profile'))
+        return video, audio
+        
+    def _can_normalize(self, signatures, reference, mismatched, output_file):
+        """Check whether the mismatched inputs can be conformed to the reference without
+        joining another encoder's output to the reference streams by stream copy"""
+        ref_video, ref_audio = reference
+        retimes = Path(output_file).suffix[1:].lower() in TIMESCALE_CONTAINERS
+        for index in mismatched:
+            video, audio = signatures[index]
+            
+            # The muxer keeps the first file's codec headers, so video can only
+            # be copied, at most into the reference time base
+            if ref_video and video != ref_video:
+                if not (video and retimes and video[:-1] == ref_video[:-1]):
+                    return False
+                    
+            if ref_audio and audio != ref_audio:
+                codec, profile = ref_audio[0], ref_audio[3]
+                if codec not in CODEC_ENCODERS:
+                    return False
+                if codec in CODEC_PROFILES and profile not in CODEC_PROFILES[codec]:
+                    return False
+        return True
+        
+    def _can_concat_copy(self, reference, output_file):
+        """Check whether the output container can hold the reference codecs as they are"""
+        supported = CONTAINER_CODECS.get(Path(output_file).suffix[1:].lower())
+        if supported is None:
+            return False
+            
+        for kind, stream in zip(('video', 'audio'), reference):
+            if stream is None:
+                continue
+            if kind not in supported:
+                return False
+            if supported[kind] is not ANY_CODEC and stream[0] not in supported[kind]:
+                return False
+        return True
+        
+    def _total_duration(self, infos):
+        """Combined duration of the inputs, shaped like a probe result for progress"""
+        total = 0.0
+        for info in infos:
+            try:
+                total += float(info['format']['duration'])
+            except (KeyError, TypeError, ValueError):
+                pass
+        return {'format': {'duration': str(total)}} if total else None
+        
+    def _write_concat_list(self, list_file, paths):
+        """Write a concat demuxer list file"""
+        with open(list_file, 'w', encoding='utf-8') as f:
+            for path in paths:
+                escaped = os.path.abspath(path).replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+                
+    def _concat_copy(self, input_files, output_file, infos, progress_callback=None):
+        """Join inputs with identical parameters using the concat demuxer"""
+        list_fd, list_file = tempfile.mkstemp(prefix='.merge_', suffix='.txt',
+                                              dir=os.path.dirname(os.path.abspath(output_file)))
+        os.close(list_fd)
         try:
-            self.logger.info(f"Running FFMPEG: {' '.join(cmd)}")
+            self._write_concat_list(list_file, input_files)
+            cmd = [
+                self.get_ffmpeg_path(),
+                '-f', 'concat', '-safe', '0', '-i', list_file,
+                '-map', '0', '-c', 'copy',
+                '-y', output_file
+            ]
+            return self._run_ffmpeg_process(cmd, progress_callback, input_files[0], self._total_duration(infos))
+            
+        finally:
+            os.remove(list_file)
+            
+    @staticmethod
+    def _stage_progress(report, start, span):
+        """Map one step's 0-100% progress onto start..start+span of the whole operation"""
+        def callback(progress, details=None):
+            report(None if progress is None else start + progress * span / 100, details)
+        return callback
+        
+    def _concat_normalized(self, input_files, output_file, infos, signatures, reference, mismatched, progress_callback=None):
+        """Conform only the mismatched inputs to the reference parameters, then stream copy"""
+        work_dir = tempfile.mkdtemp(prefix='.merge_', dir=os.path.dirname(os.path.abspath(output_file)))
+        
+        # Progress: normalizing 80%, joining 20%
+        def report(progress, details=None):
+            if progress_callback:
+                progress_callback(None if progress is None else min(progress, 100.0), details)
+                
+        try:
+            parts = list(input_files)
+            for step, index in enumerate(mismatched):
+                normalized = os.path.join(work_dir, f"part_{index:05d}{Path(output_file).suffix}")
+                cmd = self._normalize_cmd(input_files[index], signatures[index], reference, normalized)
+                base = step * 80 / len(mismatched)
+                self._run_ffmpeg_process(cmd, self._stage_progress(report, base, 80 / len(mismatched)),
+                                         input_files[index], infos[index])
+                parts[index] = normalized
+                
+            result = self._concat_copy(parts, output_file, infos, self._stage_progress(report, 80, 20))
+            report(100.0)
+            return result
+            
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            
+    def _normalize_cmd(self, input_file, signature, reference, output_file):
+        """FFMPEG command that converts one input to the reference stream parameters:
+        video is copied into the reference time base, audio is re-encoded, and
+        silence is added for missing audio"""
+        cmd = [self.get_ffmpeg_path(), '-i', input_file]
+        ref_video, ref_audio = reference
+        video, audio = signature
+        
+        # The generated source is endless, so -shortest ends it with the real stream
+        audio_input = 0
+        if ref_audio and not audio:
+            cmd.extend(['-f', 'lavfi', '-i',
+                        f'anullsrc=r={ref_audio[1]}:cl={self._channel_layout(ref_audio[2])}'])
+            audio_input = 1
+            
+        if ref_video:
+            cmd.extend(['-map', '0:v:0', '-c:v', 'copy'])
+            time_base = ref_video[7]
+            if time_base and video[7] != time_base:
+                cmd.extend(['-video_track_timescale', time_base.split('/')[-1]])
+        if ref_audio:
+            cmd.extend(['-map', f'{audio_input}:a:0'])
+            if audio == ref_audio:
+                cmd.extend(['-c:a', 'copy'])
+            else:
+                codec, sample_rate, channels, profile = ref_audio
+                cmd.extend(['-c:a', CODEC_ENCODERS[codec]])
+                cmd.extend(CODEC_PROFILES.get(codec, {}).get(profile, []))
+                cmd.extend(['-ar', str(sample_rate), '-ac', str(channels)])
+                
+        if audio_input:
+            cmd.append('-shortest')
+        cmd.extend(['-y', output_file])
+        return cmd
+        
+    def _channel_layout(self, channels):
+        """FFMPEG channel layout name for a channel count"""
+        return {1: 'mono', 2: 'stereo'}.get(channels, f'{channels}c')
+        
+    def _concat_filter(self, input_files, output_file, infos, signatures, progress_callback=None):
+        """Decode and join inputs with the concat filter, conforming every input to the
+        first one's frame size and filling missing streams"""
+        has_video = any(video for video, _ in signatures)
+        has_audio = any(audio for _, audio in signatures)
+        first_video = next((video for video, _ in signatures if video), None)
+        width, height = (first_video[1], first_video[2]) if first_video else (None, None)
+        
+        cmd = [self.get_ffmpeg_path()]
+        for input_file in input_files:
+            cmd.extend(['-i', input_file])
+            
+        # The concat filter needs every segment to carry the same stream types
+        filters = []
+        segments = ''
+        for i, ((video, audio), info) in enumerate(zip(signatures, infos)):
+            duration = info.get('format', {}).get('duration', '0')
+            if has_video:
+                if video:
+                    filters.append(f'[{i}:v:0]scale={width}:{height}:force_original_aspect_ratio=decrease,'
+                                   f'pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1[v{i}]')
+                else:
+                    filters.append(f'color=c=black:s={width}x{height}:d={duration}[v{i}]')
+                segments += f'[v{i}]'
+            if has_audio:
+                if audio:
+                    filters.append(f'[{i}:a:0]aformat=sample_rates=48000:channel_layouts=stereo[a{i}]')
+                else:
+                    filters.append(f'anullsrc=r=48000:cl=stereo,atrim=duration={duration}[a{i}]')
+                segments += f'[a{i}]'
+                
+        filters.append(f'{segments}concat=n={len(input_files)}:v={int(has_video)}:a={int(has_audio)}'
+                       + ('[outv]' if has_video else '') + ('[outa]' if has_audio else ''))
+        cmd.extend(['-filter_complex', ';'.join(filters)])
+        if has_video:
+            cmd.extend(['-map', '[outv]'])
+        if has_audio:
+            cmd.extend(['-map', '[outa]'])
+            
+        # Output file
+        cmd.extend(['-y', output_file])
+        
+        return self._run_ffmpeg_process(cmd, progress_callback, input_files[0], self._total_duration(infos))
+        
+    def _run_ffmpeg_process(self, cmd, progress_callback=None, input_file=None, media_info=None, output_indices=None,
+                            parallel_jobs=1):
+        """Run FFMPEG process with progress monitoring
+        
+        media_info is the caller's probe result for input_file, if it has one.
+        output_indices are the positions of the output files in cmd; by
+        default cmd has a single output at the end. parallel_jobs is how many
+        FFMPEG processes the caller runs at once for the same job.
+        """
+        job_id = None
+        try:
+            # Share of the CPU budget, sized for every process that may run at
+            # once: one per process worker, plus the caller's extra processes
+            process_workers = self.config.getint('processing', 'process_workers', fallback=2)
+            job_id, threads = self.thread_budget.acquire(max(1, process_workers) + parallel_jobs - 1)
+            thread_args = ['-filter_threads', str(threads), '-filter_complex_threads', str(threads)]
+            
+            # Structured progress on stdout; stderr only carries diagnostics
+            # -threads is an output option, so it goes before every output file
+            cmd = list(cmd)
+            for index in sorted(output_indices or [len(cmd) - 1], reverse=True):
+                cmd[index:index] = ['-threads', str(threads)]
+            cmd = cmd[:1] + ['-progress', 'pipe:1', '-nostats'] + thread_args + cmd[1:]
+            
+            self.logger.info(f"Running FFMPEG with {threads} thread(s): {' '.join(cmd)}")
             
             # Get duration for progress calculation
             duration = None
             if input_file and progress_callback:
                 try:
-                    info = self.get_media_info(input_file)
+                    info = media_info or self.get_media_info(input_file)
                     duration = float(info['format']['duration'])
                 except Exception:
                     pass
@@ -198,8 +808,9 @@ class FFMPEGWrapper:
             # Start process
             process = subprocess.Popen(
                 cmd,
+                stdin=subprocess.DEVNULL,
                 stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
+                stderr=subprocess.PIPE,
                 text=True,
                 universal_newlines=True
             )
@@ -208,36 +819,49 @@ class FFMPEGWrapper:
             process_id = id(process)
             self.active_processes[process_id] = process
             
+            # Keep only the tail of stderr for error reporting
+            stderr_lines = deque(maxlen=self.STDERR_TAIL_LINES)
+            stderr_thread = threading.Thread(
+                target=self._drain_stderr,
+                args=(process.stderr, stderr_lines),
+                daemon=True
+            )
+            stderr_thread.start()
+            
             try:
-                output_lines = []
-                
                 # Monitor progress
+                block = {}
+                reported_end = False
                 for line in process.stdout:
-                    line = line.strip()
-                    if line:
-                        output_lines.append(line)
-                        self.logger.debug(f"ffmpeg: {line}")
+                    key, sep, value = line.strip().partition('=')
+                    if not sep:
+                        continue
+                    block[key] = value
+                    
+                    # Each block ends with progress=continue or progress=end; the
+                    # percentage is None when the duration is unknown
+                    if key == 'progress':
+                        if progress_callback:
+                            progress = FFmpegProgress.from_block(block, duration)
+                            progress_callback(progress.percent, progress)
+                            reported_end = progress.status == 'end'
+                        block = {}
                         
-                        # Parse progress
-                        if progress_callback and duration:
-                            progress = self._parse_ffmpeg_progress(line, duration)
-                            if progress is not None:
-                                progress_callback(progress)
-                                
                 # Wait for completion
                 return_code = process.wait()
+                stderr_thread.join(timeout=5)
                 
                 if return_code == 0:
-                    if progress_callback:
-                        progress_callback(100.0)
+                    if progress_callback and not reported_end:
+                        progress_callback(100.0, FFmpegProgress(status='end'))
                         
                     return {
                         'success': True,
                         'message': 'Processing completed successfully',
-                        'output': '\n'.join(output_lines)
+                        'output': '\n'.join(stderr_lines)
                     }
                 else:
-                    raise Exception(f"FFMPEG failed with return code {return_code}: {' '.join(output_lines[-5:])}")
+                    raise Exception(f"FFMPEG failed with return code {return_code}: {' '.join(list(stderr_lines)[-5:])}")
                     
             finally:
                 # Clean up process reference
@@ -248,26 +872,20 @@ class FFMPEGWrapper:
             self.logger.error(f"FFMPEG process error: {str(e)}")
             raise
             
-    def _parse_ffmpeg_progress(self, line, duration):
-        """Parse progress from FFMPEG output"""
-        try:
-            # Look for time= in the output
-            time_match = re.search(r'time=(\d{2}):(\d{2}):(\d{2}(?:\.\d+)?)', line)
-            if time_match:
-                hours = int(time_match.group(1))
-                minutes = int(time_match.group(2))
-                seconds = float(time_match.group(3))
-                
-                current_time = hours * 3600 + minutes * 60 + seconds
-                progress = (current_time / duration) * 100
+        finally:
+            if job_id is not None:
+                self.thread_budget.release(job_id)
                 
-                return min(progress, 100.0)
-                
-        except (ValueError, AttributeError):
+    def _drain_stderr(self, stream, lines):
+        """Collect FFMPEG diagnostics into a bounded buffer"""
+        try:
+            for line in stream:
+                line = line.strip()
+                if line:
+                    lines.append(line)
+        except (OSError, ValueError):
             pass
             
-        return None
-        
     def cancel_process(self, process_id):
         """Cancel an active FFMPEG process"""
         if process_id in self.active_processes:
@@ -284,3 +902,4 @@ class FFMPEGWrapper:
         """Cleanup all active processes"""
         for process_id in list(self.active_processes.keys()):
             self.cancel_process(process_id)
+        self.probe_cache.close()
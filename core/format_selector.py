@@ -0,0 +1,361 @@
+"""
+Target-aware yt-dlp format selection
+"""
+
+import re
+
+from core.ffmpeg_wrapper import ANY_CODEC, CONTAINER_CODECS, REENCODE_OPTIONS
+
+# Output formats produced by audio extraction rather than video conversion
+AUDIO_FORMATS = ('mp3', 'wav', 'flac', 'aac')
+
+# FFMPEG codec names for the codec strings yt-dlp reports, by prefix
+YTDLP_CODECS = {
+    'avc1': 'h264', 'avc3': 'h264', 'h264': 'h264',
+    'hev1': 'hevc', 'hvc1': 'hevc', 'h265': 'hevc', 'hevc': 'hevc',
+    'vp09': 'vp9', 'vp9': 'vp9', 'vp8': 'vp8', 'av01': 'av1', 'av1': 'av1',
+    'mp4a': 'aac', 'aac': 'aac', 'mp3': 'mp3', 'opus': 'opus', 'vorbis': 'vorbis',
+    'flac': 'flac', 'alac': 'alac', 'ac-3': 'ac3', 'ac3': 'ac3', 'ec-3': 'eac3', 'eac3': 'eac3'
+}
+
+# yt-dlp acodec prefixes matching each FFMPEG audio codec, for format filters
+AUDIO_CODEC_FILTERS = {
+    'aac': 'mp4a', 'mp3': 'mp3', 'opus': 'opus', 'vorbis': 'vorbis',
+    'flac': 'flac', 'alac': 'alac', 'ac3': 'ac-3', 'eac3': 'ec-3'
+}
+
+# yt-dlp vcodec prefixes matching each FFMPEG video codec, for format filters
+VIDEO_CODEC_FILTERS = {
+    'h264': ('avc1', 'avc3'), 'hevc': ('hev1', 'hvc1'), 'vp9': ('vp09', 'vp9'),
+    'vp8': ('vp8',), 'av1': ('av01',)
+}
+
+# Containers yt-dlp can merge separate video and audio formats into
+MERGE_CONTAINERS = ('mp4', 'mkv', 'webm', 'mov', 'flv', 'avi')
+
+# Audio codecs implied by the extension of formats that don't report one
+EXT_AUDIO_CODECS = {'m4a': 'aac', 'mp3': 'mp3', 'opus': 'opus', 'ogg': 'vorbis', 'flac': 'flac'}
+
+# Lossless sources are preferred for lossless targets, and avoided otherwise
+LOSSLESS_CODECS = ('flac', 'alac')
+LOSSLESS_TARGETS = ('flac', 'wav')
+
+# Codecs that play wherever the container does, preferred over the other
+# codecs it can hold by stream copy
+PREFERRED_CODECS = {
+    'mp4': {'video': ('h264',), 'audio': ('aac',)},
+    'mov': {'video': ('h264',), 'audio': ('aac',)}
+}
+
+def codec_name(ytdlp_codec):
+    """FFMPEG codec name for a yt-dlp codec string, or None for 'none' and unknown codecs"""
+    if not ytdlp_codec or ytdlp_codec == 'none':
+        return None
+    prefix = ytdlp_codec.lower().split('.')[0]
+    return YTDLP_CODECS.get(prefix, prefix)
+
+def codec_preference(container, kind, codec):
+    """Rank of a codec among the container's preferred ones, 0 being the most preferred"""
+    preferred = PREFERRED_CODECS.get(container, {}).get(kind, ())
+    return preferred.index(codec) if codec in preferred else len(preferred)
+
+def merge_output_format(format_spec, container):
+    """--merge-output-format value for a format, or None if it needs no merge"""
+    if not format_spec or '+' not in format_spec:
+        return None
+    if container in MERGE_CONTAINERS and container != 'mkv':
+        return f"{container}/mkv"  # yt-dlp falls back to mkv for codecs the target can't hold
+    return 'mkv'
+
+def merge_container(video_codec, audio_codec, container):
+    """Container to join separately downloaded FFMPEG video and audio codecs in by stream copy"""
+    supported = CONTAINER_CODECS.get(container)
+    if container in MERGE_CONTAINERS and supported:
+        if all(
+            kind in supported and (supported[kind] is ANY_CODEC or codec in supported[kind])
+            for kind, codec in (('video', video_codec), ('audio', audio_codec))
+        ):
+            return container
+    return 'mkv'
+
+class FormatSelector:
+    """Chooses what yt-dlp downloads from what the job will turn it into
+    
+    With the metadata format list at hand a concrete format id is picked;
+    otherwise a yt-dlp format expression with the same preferences is built.
+    Audio targets get an audio-only format. Video targets get the format that
+    meets the resolution the job needs with the least transcoding (codecs the
+    target container can take by stream copy), then the container's most
+    compatible codecs (H.264 and AAC for mp4) and then the fewest bytes.
+    """
+    
+    def __init__(self, config, logger):
+        self.config = config
+        self.logger = logger
+        
+    def audio_target(self, options=None):
+        """Audio format the job ends up in, or None if it keeps video"""
+        options = options or {}
+        if 'outputs' in options:
+            targets = [target if isinstance(target, str) else target.get('format') for target in options['outputs']]
+            if targets and all(target in AUDIO_FORMATS for target in targets):
+                return targets[0]
+            return None
+            
+        if 'convert_to' in options:
+            return options['convert_to'] if options['convert_to'] in AUDIO_FORMATS else None
+            
+        if options.get('extract_audio') or self.config.getboolean('download', 'extract_audio', fallback=False):
+            return self.config.get('output', 'audio_format', fallback='mp3')
+        return None
+        
+    def video_target(self, options=None):
+        """Video container the job ends up in"""
+        options = options or {}
+        for target in options.get('outputs', ()):
+            target = target if isinstance(target, str) else target.get('format')
+            if target not in AUDIO_FORMATS:
+                return target
+        if options.get('convert_to'):
+            return options['convert_to']
+        return self.config.get('output', 'video_format', fallback='mp4')
+        
+    def select(self, options=None, info=None, merge=True):
+        """yt-dlp format for a job, or None to keep the quality defaults
+        
+        With merge=False (no FFMPEG to join streams) only formats carrying
+        both video and audio are chosen for a video target.
+        """
+        if options and 'format' in options:
+            return None  # Explicitly requested formats win
+            
+        formats = (info or {}).get('formats')
+        target = self.audio_target(options)
+        if target is not None:
+            if formats:
+                chosen = self._pick_audio(formats, target)
+                if chosen:
+                    self.logger.info(
+                        f"Selected audio format {chosen['format_id']} "
+                        f"({chosen.get('acodec')}, {chosen.get('abr') or '?'}k) for {target} output"
+                    )
+                    return chosen['format_id']
+            return self._audio_expression(target)
+            
+        target = self.video_target(options)
+        if formats:
+            chosen = self._pick_video(formats, target, options or {}, info.get('duration'), merge)
+            if chosen:
+                video, audio = chosen
+                self.logger.info(
+                    f"Selected video format {video['format_id']} ({video.get('vcodec')}, "
+                    f"{video.get('height') or '?'}p)"
+                    + (f" with audio {audio['format_id']} ({audio.get('acodec')})" if audio else '')
+                    + f" for {target} output"
+                )
+                return f"{video['format_id']}+{audio['format_id']}" if audio else video['format_id']
+        return self._video_expression(target, options or {}, merge)
+        
+    def _copyable_audio(self, target):
+        """FFMPEG audio codecs a target container takes without re-encoding; ANY_CODEC for all"""
+        return CONTAINER_CODECS.get(target, {}).get('audio', set())
+        
+    def _pick_audio(self, formats, target):
+        """Cheapest audio-only format to turn into the target, or None if there is none"""
+        candidates = [
+            fmt for fmt in formats
+            if fmt.get('format_id') and fmt.get('vcodec') == 'none' and self.audio_codec(fmt)
+        ]
+        if not candidates:
+            return None
+            
+        copyable = self._copyable_audio(target)
+        wanted_bitrate = self._wanted_bitrate()
+        
+        def cost(fmt):
+            codec = self.audio_codec(fmt)
+            bitrate = fmt.get('abr') or fmt.get('tbr') or 0
+            lossless_source = codec in LOSSLESS_CODECS
+            if copyable is ANY_CODEC or codec in copyable:
+                # Stream copy, though a lossless source is many times the
+                # size of a lossy one a lossy target could copy instead
+                transcode = 1 if lossless_source and target not in LOSSLESS_TARGETS else 0
+            elif target in LOSSLESS_TARGETS and lossless_source:
+                transcode = 1  # Lossless to lossless, no generation loss
+            else:
+                transcode = 2
+                
+            # Within a tier, codecs the target plays everywhere with, e.g. AAC in mp4
+            preference = codec_preference(target, 'audio', codec)
+            
+            # Then best quality first, or the smallest format that
+            # still meets the configured bitrate
+            if wanted_bitrate == 'worst':
+                quality = bitrate
+            elif wanted_bitrate is None:
+                quality = -bitrate
+            elif bitrate >= wanted_bitrate:
+                quality = bitrate - wanted_bitrate
+            else:
+                quality = wanted_bitrate - bitrate + 100000  # Too low, only if nothing meets it
+            return (transcode, preference, quality)
+            
+        return min(candidates, key=cost)
+        
+    def _pick_video(self, formats, target, options, duration=None, merge=True):
+        """(video format, separate audio format or None) to turn into the target, or None"""
+        video_formats = [
+            fmt for fmt in formats
+            if fmt.get('format_id') and codec_name(fmt.get('vcodec')) and fmt.get('ext') != 'mhtml'
+        ]
+        if not video_formats:
+            return None
+            
+        # Audio to pair with video-only formats, chosen like an audio target
+        audio = self._pick_audio(formats, target) if merge else None
+        candidates = []
+        for fmt in video_formats:
+            if fmt.get('acodec') == 'none':
+                if audio:
+                    candidates.append((fmt, audio))
+            else:
+                candidates.append((fmt, None))
+        if not candidates:
+            return None
+            
+        max_height = self._max_height()
+        wanted_height = self._resolution_height(options)
+        quality = self.config.get('download', 'video_quality', fallback='best')
+        supported = CONTAINER_CODECS.get(target, {})
+        video_copyable = supported.get('video', set()) if target in CONTAINER_CODECS else ANY_CODEC
+        audio_copyable = supported.get('audio', set()) if target in CONTAINER_CODECS else ANY_CODEC
+        reencode = {kind: any(key in options for key in keys) for kind, keys in REENCODE_OPTIONS.items()}
+        
+        def copies(codec, copyable):
+            return copyable is ANY_CODEC or codec in copyable
+            
+        def cost(candidate):
+            video, audio_fmt = candidate
+            height = video.get('height') or 0
+            
+            # Resolution first: within the quality cap, and for a resized
+            # output the smallest source that needn't be upscaled
+            fits = 0 if max_height is None or height <= max_height else 1
+            if fits:
+                # Nothing within the cap: the least oversized source
+                size_rank = (0, height)
+            elif wanted_height:
+                size_rank = (0, height) if height >= wanted_height else (1, -height)
+            elif quality == 'worst':
+                size_rank = (0, height)
+            else:
+                size_rank = (0, -height)
+                
+            # Then avoid re-encoding, video far more than audio
+            video_encode = 1 if reencode['video'] or not copies(codec_name(video.get('vcodec')), video_copyable) else 0
+            audio_source = audio_fmt if audio_fmt else video
+            audio_encode = 1 if reencode['audio'] or not copies(self.audio_codec(audio_source), audio_copyable) else 0
+            
+            # Then codecs the target plays everywhere with, e.g. H.264 and AAC in mp4
+            preference = (
+                codec_preference(target, 'video', codec_name(video.get('vcodec'))),
+                codec_preference(target, 'audio', self.audio_codec(audio_source))
+            )
+            
+            # Then transfer the fewest bytes
+            transfer = self.estimated_size(video, duration)
+            if audio_fmt:
+                transfer += self.estimated_size(audio_fmt, duration)
+            return (fits, size_rank, video_encode, audio_encode, preference, transfer)
+            
+        return min(candidates, key=cost)
+        
+    def estimated_size(self, fmt, duration=None):
+        """Bytes a format will transfer, inf if unknown"""
+        size = fmt.get('filesize') or fmt.get('filesize_approx')
+        if size:
+            return size
+        if fmt.get('tbr') and duration:
+            return fmt['tbr'] * 1000 / 8 * duration
+        return float('inf')
+        
+    def _max_height(self):
+        """Height cap from the video_quality setting, e.g. 720 for '720p'"""
+        quality = self.config.get('download', 'video_quality', fallback='best')
+        if quality in ('best', 'worst'):
+            return None
+        try:
+            return int(quality.rstrip('p'))
+        except ValueError:
+            return None
+            
+    def _resolution_height(self, options):
+        """Output height of a job resized with the 'resolution' option, e.g. 720 for '1280x720'"""
+        match = re.match(r'^\s*\d+\s*[x:]\s*(\d+)\s*$', str(options.get('resolution', '')))
+        return int(match.group(1)) if match else None
+        
+    def _video_expression(self, target, options, merge=True):
+        """yt-dlp format expression for a video target, without a format list"""
+        heights = [height for height in (self._max_height(), self._resolution_height(options)) if height]
+        cap = f"[height<={min(heights)}]" if heights else ''
+        worst = self.config.get('download', 'video_quality', fallback='best') == 'worst'
+        video, audio, single = ('worstvideo', 'worstaudio', 'worst') if worst else ('bestvideo', 'bestaudio', 'best')
+        if not merge:
+            # Without FFMPEG separate streams would be left unmerged
+            return f"{single}{cap}/{single}" if cap else single
+            
+        # Leave out codecs the target container would have to re-encode
+        alternatives = []
+        excluded = ''
+        copyable = CONTAINER_CODECS.get(target, {}).get('video', ANY_CODEC)
+        if copyable is not ANY_CODEC and not any(key in options for key in REENCODE_OPTIONS['video']):
+            excluded = ''.join(
+                f"[vcodec!^={prefix}]"
+                for codec, prefixes in VIDEO_CODEC_FILTERS.items() if codec not in copyable
+                for prefix in prefixes
+            )
+            
+        # Pair the video with audio in the container's preferred codec where
+        # there is one; the video codec isn't filtered as that would trade
+        # away resolution
+        for codec in PREFERRED_CODECS.get(target, {}).get('audio', ()):
+            if codec in AUDIO_CODEC_FILTERS:
+                alternatives.append(f"{video}{cap}{excluded}+{audio}[acodec^={AUDIO_CODEC_FILTERS[codec]}]")
+        if excluded:
+            alternatives.append(f"{video}{cap}{excluded}+{audio}")
+        for alternative in (f"{video}{cap}+{audio}", f"{single}{cap}", single):
+            if alternative not in alternatives:
+                alternatives.append(alternative)
+        return '/'.join(alternatives)
+        
+    def audio_codec(self, fmt):
+        """FFMPEG audio codec of a format, falling back to its extension"""
+        acodec = fmt.get('acodec')
+        if acodec == 'none':
+            return None
+        return codec_name(acodec) or EXT_AUDIO_CODECS.get(fmt.get('audio_ext') or fmt.get('ext'))
+        
+    def _wanted_bitrate(self):
+        """Configured audio quality: None for best, 'worst', or a bitrate in kbps"""
+        audio_quality = self.config.get('download', 'audio_quality', fallback='best')
+        if audio_quality == 'worst':
+            return 'worst'
+        try:
+            return float(str(audio_quality).lower().rstrip('k'))
+        except ValueError:
+            return None
+            
+    def _audio_expression(self, target):
+        """yt-dlp format expression preferring audio-only formats in codecs the target can copy"""
+        order = 'worstaudio' if self._wanted_bitrate() == 'worst' else 'bestaudio'
+        copyable = self._copyable_audio(target)
+        alternatives = []
+        if copyable is not ANY_CODEC:
+            # Lossy codecs first unless the target is lossless
+            lossless_first = target in LOSSLESS_TARGETS
+            for codec in sorted(copyable, key=lambda codec: ((codec in LOSSLESS_CODECS) != lossless_first,
+                                                             codec_preference(target, 'audio', codec), codec)):
+                if codec in AUDIO_CODEC_FILTERS:
+                    alternatives.append(f"{order}[acodec^={AUDIO_CODEC_FILTERS[codec]}]")
+        alternatives.extend([order, 'best'])
+        return '/'.join(alternatives)
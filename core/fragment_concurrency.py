@@ -0,0 +1,83 @@
+"""
+Fragment download concurrency for HLS and DASH downloads
+"""
+
+import threading
+
+class FragmentConcurrency:
+    """Chooses how many fragments yt-dlp downloads at once, per host
+    
+    In fixed mode this is download.concurrent_fragments. In adaptive mode
+    that setting is the starting point: a host's concurrency is raised while
+    doing so still improves throughput, lowered when fragment errors become
+    frequent, and halved (with a ceiling just below) when the host answers
+    with HTTP 429 or 403. Settings are read on every call, so changes apply
+    to the next download without a restart.
+    """
+    
+    # Upper bound for adaptive concurrency
+    MAX_CONCURRENCY = 16
+    
+    # Share of fragments that may need a retry before concurrency is lowered
+    MAX_ERROR_RATE = 0.05
+    
+    # Throughput gain that justifies another concurrent fragment
+    MIN_GAIN = 1.1
+    
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.Lock()
+        self.hosts = {}  # host -> {'current', 'ceiling', 'throughput': {concurrency: bytes/s}}
+        
+    def configured(self):
+        """Configured fragment concurrency"""
+        return max(1, self.config.getint('download', 'concurrent_fragments', fallback=4))
+        
+    def adaptive(self):
+        """Check whether concurrency adapts to each host"""
+        return self.config.getboolean('download', 'adaptive_fragments', fallback=True)
+        
+    def get(self, host):
+        """Number of fragments to download at once from a host"""
+        if not self.adaptive():
+            return self.configured()
+        with self.lock:
+            return self._state(host)['current']
+            
+    def _state(self, host):
+        """Adaptive state of a host; must hold the lock"""
+        state = self.hosts.get(host)
+        if state is None:
+            start = min(self.configured(), self.MAX_CONCURRENCY)
+            state = self.hosts[host] = {'current': start, 'ceiling': self.MAX_CONCURRENCY, 'throughput': {}}
+        return state
+        
+    def record(self, host, concurrency, throughput, fragments, errors):
+        """Learn from a finished fragmented download; throughput in bytes per second"""
+        if not self.adaptive() or not fragments:
+            return
+        with self.lock:
+            state = self._state(host)
+            measured = state['throughput']
+            measured[concurrency] = max(measured.get(concurrency, 0), throughput or 0)
+            
+            if errors / fragments > self.MAX_ERROR_RATE:
+                state['current'] = max(1, concurrency - 1)
+                return
+                
+            # Keep climbing while the last step paid off, step back if it hurt
+            previous = measured.get(concurrency - 1)
+            if previous is None or measured[concurrency] >= previous * self.MIN_GAIN:
+                state['current'] = min(concurrency + 1, state['ceiling'])
+            elif measured[concurrency] < previous:
+                state['current'] = max(1, concurrency - 1)
+            else:
+                state['current'] = concurrency
+                
+    def throttled(self, host, concurrency):
+        """Back off after HTTP 429 or 403 from a host; returns the new concurrency"""
+        with self.lock:
+            state = self._state(host)
+            state['ceiling'] = max(1, concurrency - 1)
+            state['current'] = max(1, concurrency // 2)
+            return state['current']
@@ -0,0 +1,150 @@
+"""
+Persistent SQLite journal of processing queue items
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# Columns stored for every queue item, in table order
+JOB_COLUMNS = ('id', 'parent_id', 'source', 'type', 'options', 'status', 'priority', 'progress',
+               'error_message', 'output_file', 'created_at', 'started_at', 'completed_at')
+
+class JobStore:
+    """Write-ahead-logged journal of queue item states, written in batches by a background thread"""
+    
+    def __init__(self, logger, db_path=None, flush_interval=0.5, batch_size=500, keep_days=7):
+        if db_path is None:
+            db_path = Path.home() / '.media_processor' / 'queue.db'
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        
+        self.logger = logger
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.db_lock = threading.Lock()
+        self.conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                parent_id TEXT,
+                source TEXT NOT NULL,
+                type TEXT NOT NULL,
+                options TEXT NOT NULL,
+                status TEXT NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 0,
+                progress REAL NOT NULL,
+                error_message TEXT NOT NULL,
+                output_file TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                completed_at REAL
+            )
+        ''')
+        columns = {row[1] for row in self.conn.execute('PRAGMA table_info(jobs)')}
+        if 'priority' not in columns:
+            self.conn.execute('ALTER TABLE jobs ADD COLUMN priority INTEGER NOT NULL DEFAULT 0')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_parent ON jobs (parent_id)')
+        
+        # Drop old finished jobs, keeping the entries of playlists still in progress
+        self.conn.execute('''
+            DELETE FROM jobs WHERE status IN ('completed', 'error') AND completed_at < ?
+            AND (parent_id IS NULL OR parent_id NOT IN (
+                SELECT id FROM jobs WHERE status IN ('queued', 'processing')))
+        ''', (time.time() - keep_days * 86400,))
+        self.conn.commit()
+        
+        # Latest state per job id, or None for a deletion, waiting to be written
+        self.pending = {}
+        self.closed = False
+        self.pending_changed = threading.Condition()
+        self.writer = threading.Thread(target=self._write_loop, daemon=True)
+        self.writer.start()
+        
+    def record(self, job):
+        """Queue a job state (a dict with JOB_COLUMNS) for writing"""
+        row = tuple(json.dumps(job[column]) if column == 'options' else job[column] for column in JOB_COLUMNS)
+        with self.pending_changed:
+            self.pending[job['id']] = row
+            if len(self.pending) >= self.batch_size:
+                self.pending_changed.notify()
+                
+    def delete(self, job_ids):
+        """Queue jobs for removal from the journal"""
+        with self.pending_changed:
+            for job_id in job_ids:
+                self.pending[job_id] = None
+            if len(self.pending) >= self.batch_size:
+                self.pending_changed.notify()
+                
+    def _write_loop(self):
+        """Write pending changes every flush_interval, or sooner once a batch fills up"""
+        while True:
+            with self.pending_changed:
+                if not self.closed and len(self.pending) < self.batch_size:
+                    self.pending_changed.wait(self.flush_interval)
+                batch, self.pending = self.pending, {}
+                closed = self.closed
+                
+            if batch:
+                try:
+                    self._write(batch)
+                except sqlite3.Error as e:
+                    self.logger.error(f"Error writing queue journal: {str(e)}")
+                    
+            if closed:
+                return
+                
+    def _write(self, batch):
+        """Write one batch of changes in a single transaction"""
+        rows = [row for row in batch.values() if row is not None]
+        deleted = [(job_id,) for job_id, row in batch.items() if row is None]
+        placeholders = ', '.join('?' for _ in JOB_COLUMNS)
+        with self.db_lock:
+            with self.conn:
+                if rows:
+                    self.conn.executemany(
+                        f"INSERT OR REPLACE INTO jobs ({', '.join(JOB_COLUMNS)}) VALUES ({placeholders})",
+                        rows
+                    )
+                if deleted:
+                    self.conn.executemany('DELETE FROM jobs WHERE id = ?', deleted)
+                    
+    def load_unfinished(self):
+        """Jobs that were queued or processing when the journal was last written, oldest first"""
+        return self._load("status IN ('queued', 'processing') ORDER BY created_at")
+        
+    def load_children(self, parent_id):
+        """All recorded entries of an expanded playlist"""
+        return self._load('parent_id = ? ORDER BY created_at', (parent_id,))
+        
+    def _load(self, where, params=()):
+        """Load jobs as dicts"""
+        with self.db_lock:
+            rows = self.conn.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE {where}", params).fetchall()
+            
+        jobs = []
+        for row in rows:
+            job = dict(zip(JOB_COLUMNS, row))
+            try:
+                job['options'] = json.loads(job['options'])
+            except json.JSONDecodeError:
+                job['options'] = {}
+            jobs.append(job)
+        return jobs
+        
+    def close(self):
+        """Write anything pending and close the database"""
+        with self.pending_changed:
+            if self.closed:
+                return
+            self.closed = True
+            self.pending_changed.notify()
+        self.writer.join()
+        
+        with self.db_lock:
+            self.conn.close()
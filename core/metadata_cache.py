@@ -0,0 +1,145 @@
+"""
+Persistent SQLite cache for yt-dlp media information
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+
+# Query parameters that never change which media a URL points to
+TRACKING_PARAMS = ('fbclid', 'gclid', 'si', 'feature')
+
+def normalize_url(url):
+    """Normalize a URL so equivalent links share a cache entry"""
+    parsed = urlparse(url.strip())
+    netloc = parsed.netloc.lower()
+    if netloc.startswith('www.'):
+        netloc = netloc[4:]
+        
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+        if key not in TRACKING_PARAMS and not key.startswith('utm_')
+    )
+    path = parsed.path.rstrip('/') or '/'
+    
+    return urlunparse((parsed.scheme.lower(), netloc, path, '', urlencode(query), ''))
+
+class MetadataCache:
+    """On-disk metadata cache keyed by normalized URL and extractor, with TTL and LRU eviction"""
+    
+    def __init__(self, db_path=None, ttl=3600, max_size=100 * 1024 * 1024):
+        if db_path is None:
+            db_path = Path.home() / '.media_processor' / 'metadata_cache.db'
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        
+        self.ttl = ttl
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS metadata (
+                url TEXT NOT NULL,
+                extractor TEXT NOT NULL,
+                info TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (url, extractor)
+            )
+        ''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_metadata_accessed ON metadata (accessed_at)')
+        self.conn.commit()
+        
+    def get(self, url, extractor=None):
+        """Get cached media information, or None on a miss or expired entry"""
+        key = normalize_url(url)
+        now = time.time()
+        
+        with self.lock:
+            if extractor:
+                row = self.conn.execute(
+                    'SELECT extractor, info, created_at FROM metadata WHERE url = ? AND extractor = ?',
+                    (key, extractor)
+                ).fetchone()
+            else:
+                row = self.conn.execute(
+                    'SELECT extractor, info, created_at FROM metadata WHERE url = ? ORDER BY accessed_at DESC LIMIT 1',
+                    (key,)
+                ).fetchone()
+                
+            if row is None:
+                return None
+                
+            row_extractor, info, created_at = row
+            if now - created_at > self.ttl:
+                self.conn.execute('DELETE FROM metadata WHERE url = ? AND extractor = ?', (key, row_extractor))
+                self.conn.commit()
+                return None
+                
+            self.conn.execute(
+                'UPDATE metadata SET accessed_at = ? WHERE url = ? AND extractor = ?',
+                (now, key, row_extractor)
+            )
+            self.conn.commit()
+            
+        try:
+            return json.loads(info)
+        except json.JSONDecodeError:
+            self.invalidate(url)
+            return None
+            
+    def put(self, url, info):
+        """Store media information for a URL and its canonical webpage URL"""
+        extractor = info.get('extractor_key') or info.get('extractor') or ''
+        data = json.dumps(info)
+        now = time.time()
+        
+        urls = {normalize_url(url)}
+        if info.get('webpage_url'):
+            urls.add(normalize_url(info['webpage_url']))
+            
+        with self.lock:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO metadata (url, extractor, info, size, created_at, accessed_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                [(key, extractor, data, len(data), now, now) for key in urls]
+            )
+            self._evict()
+            self.conn.commit()
+            
+    def invalidate(self, url):
+        """Remove all cached entries for a URL"""
+        with self.lock:
+            self.conn.execute('DELETE FROM metadata WHERE url = ?', (normalize_url(url),))
+            self.conn.commit()
+            
+    def clear(self):
+        """Remove all cached entries"""
+        with self.lock:
+            self.conn.execute('DELETE FROM metadata')
+            self.conn.commit()
+            
+    def _evict(self):
+        """Drop expired entries, then least recently used ones until under the size limit"""
+        self.conn.execute('DELETE FROM metadata WHERE created_at < ?', (time.time() - self.ttl,))
+        
+        total = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM metadata').fetchone()[0]
+        if total <= self.max_size:
+            return
+            
+        rows = self.conn.execute('SELECT rowid, size FROM metadata ORDER BY accessed_at').fetchall()
+        evict = []
+        for rowid, size in rows:
+            if total <= self.max_size:
+                break
+            evict.append((rowid,))
+            total -= size
+        self.conn.executemany('DELETE FROM metadata WHERE rowid = ?', evict)
+        
+    def close(self):
+        """Close the database connection"""
+        with self.lock:
+            self.conn.close()
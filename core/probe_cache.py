@@ -0,0 +1,114 @@
+"""
+Cache for ffprobe results keyed by file path, size and modification time
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+class ProbeCache:
+    """In-memory LRU cache of ffprobe results with an optional SQLite layer"""
+    
+    def __init__(self, max_entries=512, db_path=None, max_persistent_entries=20000):
+        self.max_entries = max_entries
+        self.max_persistent_entries = max_persistent_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.puts_since_evict = 0
+        
+        self.conn = None
+        if db_path is not None:
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+            self.conn = sqlite3.connect(str(db_path), check_same_thread=False)
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS probes (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    info TEXT NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            ''')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_probes_accessed ON probes (accessed_at)')
+            self.conn.commit()
+            
+    @staticmethod
+    def make_key(file_path):
+        """Build the cache key for a file: (absolute path, size, mtime_ns)"""
+        path = os.path.abspath(file_path)
+        stat = os.stat(path)
+        return path, stat.st_size, stat.st_mtime_ns
+        
+    def get(self, key):
+        """Get a cached probe result, or None if missing or the file changed"""
+        path, size, mtime_ns = key
+        
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None:
+                if entry[0] == size and entry[1] == mtime_ns:
+                    self.entries.move_to_end(path)
+                    return entry[2]
+                del self.entries[path]
+                
+            if self.conn is None:
+                return None
+                
+            row = self.conn.execute(
+                'SELECT info FROM probes WHERE path = ? AND size = ? AND mtime_ns = ?',
+                (path, size, mtime_ns)
+            ).fetchone()
+            if row is None:
+                return None
+                
+            try:
+                info = json.loads(row[0])
+            except json.JSONDecodeError:
+                return None
+                
+            self.conn.execute('UPDATE probes SET accessed_at = ? WHERE path = ?', (time.time(), path))
+            self.conn.commit()
+            self._remember(path, size, mtime_ns, info)
+            return info
+            
+    def put(self, key, info):
+        """Store a probe result"""
+        path, size, mtime_ns = key
+        
+        with self.lock:
+            self._remember(path, size, mtime_ns, info)
+            
+            if self.conn is not None:
+                self.conn.execute(
+                    'INSERT OR REPLACE INTO probes (path, size, mtime_ns, info, accessed_at) VALUES (?, ?, ?, ?, ?)',
+                    (path, size, mtime_ns, json.dumps(info), time.time())
+                )
+                
+                # Trim the table now and then rather than on every insert
+                self.puts_since_evict += 1
+                if self.puts_since_evict >= 100:
+                    self.puts_since_evict = 0
+                    self.conn.execute(
+                        'DELETE FROM probes WHERE path IN ('
+                        'SELECT path FROM probes ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)',
+                        (self.max_persistent_entries,)
+                    )
+                self.conn.commit()
+                
+    def _remember(self, path, size, mtime_ns, info):
+        """Add to the in-memory LRU; must hold the lock"""
+        self.entries[path] = (size, mtime_ns, info)
+        self.entries.move_to_end(path)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            
+    def close(self):
+        """Close the database connection"""
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
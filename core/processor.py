@@ -9,6 +9,7 @@ from urllib.parse import urlparse
 
 from core.downloader import MediaDownloader
 from core.ffmpeg_wrapper import FFMPEGWrapper
+from core.format_selector import AUDIO_FORMATS
 
 class MediaProcessor:
     """Main processor for handling media downloads and processing"""
@@ -16,8 +17,8 @@ class MediaProcessor:
     def __init__(self, config, logger):
         self.config = config
         self.logger = logger
-        self.downloader = MediaDownloader(config, logger)
         self.ffmpeg = FFMPEGWrapper(config, logger)
+        self.downloader = MediaDownloader(config, logger, self.ffmpeg)
 
         # Check for yt-dlp availability
         self.yt_dlp_available = self.downloader.is_yt_dlp_available()
@@ -29,55 +30,84 @@ class MediaProcessor:
         if not self.ffmpeg_available:
             self.logger.warning("FFMPEG executable not found or not working. Please configure its path in settings.")
         
-    def process_url(self, url, options=None, progress_callback=None):
+    def expand_playlist(self, url):
+        """Expand a playlist URL into its entries
+        
+        Returns (entries, info); entries is None for single media, and info
+        can then be passed to process_url to skip another extraction.
+        """
+        if not self.yt_dlp_available:
+            raise Exception("yt-dlp is not configured or not working. Please check settings.")
+            
+        info = self.downloader.get_cached_info(url)
+        if info:
+            return None, info
+            
+        return self.downloader.get_playlist_entries(url)
+        
+    def process_url(self, url, options=None, progress_callback=None, info=None):
         """Process a URL by downloading and optionally converting"""
+        download_result = self.download_url(url, options, progress_callback, info)
+        return self.process_downloads(url, download_result, options, progress_callback)
+        
+    def download_url(self, url, options=None, progress_callback=None, info=None):
+        """Download stage of process_url; reports the first 70% of progress"""
         try:
             self.logger.info(f"Processing URL: {url}")
 
             if not self.yt_dlp_available:
                 raise Exception("yt-dlp is not configured or not working. Please check settings.")
             
-            # Check if URL is supported
-            if not self.downloader.is_supported_url(url):
-                raise Exception("URL not supported by yt-dlp")
-                
-            # Get media information
-            try:
-                info = self.downloader.get_info(url)
-                self.logger.info(f"Media info: {info.get('title', 'Unknown')} - {info.get('duration', 'Unknown duration')}")
-            except Exception as e:
-                self.logger.warning(f"Could not get media info: {str(e)}")
-                info = {}
-                
-            # Download the media
+            # Download the media; the same yt-dlp run validates the URL and
+            # returns its metadata, so no separate probe is needed
             def download_progress(progress):
-                if progress_callback:
+                if progress_callback and progress.percent is not None:
                     # Download takes 70% of total progress
-                    progress_callback(progress * 0.7)
+                    progress_callback(progress.percent * 0.7, progress)
                     
-            download_result = self.downloader.download(url, options, download_progress)
+            # Reuse known metadata so yt-dlp doesn't extract it again
+            if info is None:
+                info = self.downloader.get_cached_info(url)
+                if info:
+                    self.logger.info(f"Using cached media info for {url}")
+                    
+            download_result = self.downloader.download(url, options, download_progress, with_info=True, info=info)
             
             if not download_result['success']:
                 raise Exception("Download failed")
                 
-            downloaded_files = download_result['output_files']
-            if not downloaded_files:
+            info = download_result.get('info', {})
+            self.logger.info(f"Media info: {info.get('title', 'Unknown')} - {info.get('duration', 'Unknown duration')}")
+            
+            if not download_result['output_files']:
                 raise Exception("No files were downloaded")
                 
+            return download_result
+            
+        except Exception as e:
+            self.logger.error(f"Error processing URL {url}: {str(e)}")
+            raise
+            
+    def process_downloads(self, url, download_result, options=None, progress_callback=None):
+        """Processing stage of process_url; reports progress from 70% to 100%"""
+        try:
+            downloaded_files = download_result['output_files']
+            
             # Process downloaded files if needed
             processed_files = []
             for i, file_path in enumerate(downloaded_files):
                 try:
+                    process_progress = None
                     if progress_callback:
                         # Processing starts at 70% and goes to 100%
                         base_progress = 70 + (i * 30 / len(downloaded_files))
                         
-                        def process_progress(progress):
-                            total_progress = base_progress + (progress * 30 / len(downloaded_files) / 100)
-                            progress_callback(min(total_progress, 100))
+                        def process_progress(progress, details=None):
+                            if progress is not None:
+                                progress = min(base_progress + (progress * 30 / len(downloaded_files) / 100), 100)
+                            progress_callback(progress, details)
                             
-                    processed_file = self._process_downloaded_file(file_path, options, process_progress)
-                    processed_files.append(processed_file)
+                    processed_files.extend(self._process_downloaded_file(file_path, options, process_progress))
                     
                 except Exception as e:
                     self.logger.error(f"Error processing file {file_path}: {str(e)}")
@@ -90,38 +120,45 @@ class MediaProcessor:
                 'original_files': downloaded_files,
                 'processed_files': processed_files,
                 'output_file': processed_files[0] if processed_files else None,
-                'info': info
+                'info': download_result.get('info', {})
             }
             
         except Exception as e:
             self.logger.error(f"Error processing URL {url}: {str(e)}")
             raise
             
-    def process_file(self, file_path, options=None, progress_callback=None):
-        """Process a local media file"""
+    def probe_file(self, file_path):
+        """Probe a local media file; returns its info, or {} if it can't be read"""
+        if not os.path.exists(file_path):
+            raise Exception(f"File not found: {file_path}")
+            
+        try:
+            info = self.ffmpeg.get_media_info(file_path)
+            self.logger.info(f"File info: {info.get('format', {}).get('duration', 'Unknown duration')}")
+            return info
+        except Exception as e:
+            self.logger.warning(f"Could not get file info: {str(e)}")
+            return {}
+            
+    def process_file(self, file_path, options=None, progress_callback=None, info=None):
+        """Process a local media file; info is the probe_file result, if already known"""
         try:
             self.logger.info(f"Processing file: {file_path}")
             
-            if not os.path.exists(file_path):
+            if info is None:
+                info = self.probe_file(file_path)
+            elif not os.path.exists(file_path):
                 raise Exception(f"File not found: {file_path}")
                 
-            # Get file information
-            try:
-                info = self.ffmpeg.get_media_info(file_path)
-                self.logger.info(f"File info: {info.get('format', {}).get('duration', 'Unknown duration')}")
-            except Exception as e:
-                self.logger.warning(f"Could not get file info: {str(e)}")
-                info = {}
-                
             # Process the file
-            processed_file = self._process_downloaded_file(file_path, options, progress_callback)
+            processed_files = self._process_downloaded_file(file_path, options, progress_callback, info or None)
             
             return {
                 'success': True,
                 'source': file_path,
                 'original_files': [file_path],
-                'processed_files': [processed_file],
-                'output_file': processed_file,
+                'processed_files': processed_files,
+                'output_file': processed_files[0],
                 'info': info
             }
             
@@ -129,16 +166,16 @@ class MediaProcessor:
             self.logger.error(f"Error processing file {file_path}: {str(e)}")
             raise
             
-    def _process_downloaded_file(self, file_path, options=None, progress_callback=None):
-        """Process a downloaded file with FFMPEG if needed"""
+    def _process_downloaded_file(self, file_path, options=None, progress_callback=None, media_info=None):
+        """Process a downloaded file with FFMPEG if needed; returns the resulting files"""
         try:
             # Check if processing is enabled
             if not self.config.getboolean('processing', 'auto_process', fallback=True):
-                return file_path
+                return [file_path]
                 
             if not self.ffmpeg_available:
                 self.logger.warning("FFMPEG is not configured or not working, skipping processing.")
-                return file_path
+                return [file_path]
                 
             # Determine output directory
             output_dir = self.config.get('output', 'directory', 
@@ -152,19 +189,34 @@ class MediaProcessor:
             # Determine what processing to do based on options or defaults
             processing_needed = False
             output_file = file_path
+            output_files = None
             
             if options:
                 # Custom processing options
-                if 'convert_to' in options:
+                if 'outputs' in options:
+                    # Several targets from a single decode of the source
+                    shared = {key: value for key, value in options.items() if key not in ('outputs', 'convert_to')}
+                    targets = []
+                    for target in options['outputs']:
+                        target_options = dict(shared)
+                        target_options.update({'format': target} if isinstance(target, str) else target)
+                        target_format = target_options.pop('format')
+                        targets.append((os.path.join(output_dir, f"{file_name}.{target_format}"), target_options))
+                        
+                    self.ffmpeg.transcode_outputs(file_path, targets, progress_callback, media_info)
+                    output_files = [target_file for target_file, _ in targets]
+                    processing_needed = True
+                    
+                elif 'convert_to' in options:
                     target_format = options['convert_to']
                     output_file = os.path.join(output_dir, f"{file_name}.{target_format}")
                     
-                    if target_format in ['mp3', 'wav', 'flac', 'aac']:
+                    if target_format in AUDIO_FORMATS:
                         # Audio extraction
-                        self.ffmpeg.extract_audio(file_path, output_file, options, progress_callback)
+                        self.ffmpeg.extract_audio(file_path, output_file, options, progress_callback, media_info)
                     else:
                         # Video conversion
-                        self.ffmpeg.convert_video(file_path, output_file, options, progress_callback)
+                        self.ffmpeg.convert_video(file_path, output_file, options, progress_callback, media_info)
                         
                     processing_needed = True
                     
@@ -172,7 +224,7 @@ class MediaProcessor:
                     # Extract audio
                     audio_format = self.config.get('output', 'audio_format', fallback='mp3')
                     output_file = os.path.join(output_dir, f"{file_name}.{audio_format}")
-                    self.ffmpeg.extract_audio(file_path, output_file, options, progress_callback)
+                    self.ffmpeg.extract_audio(file_path, output_file, options, progress_callback, media_info)
                     processing_needed = True
                     
             else:
@@ -182,7 +234,7 @@ class MediaProcessor:
                     target_format = self.config.get('output', 'video_format', fallback='mp4')
                     if file_ext[1:] != target_format:
                         output_file = os.path.join(output_dir, f"{file_name}.{target_format}")
-                        self.ffmpeg.convert_video(file_path, output_file, None, progress_callback)
+                        self.ffmpeg.convert_video(file_path, output_file, None, progress_callback, media_info)
                         processing_needed = True
                         
                 elif file_ext in ['.mp3', '.wav', '.flac', '.aac', '.ogg']:
@@ -190,7 +242,7 @@ class MediaProcessor:
                     target_format = self.config.get('output', 'audio_format', fallback='mp3')
                     if file_ext[1:] != target_format:
                         output_file = os.path.join(output_dir, f"{file_name}.{target_format}")
-                        self.ffmpeg.convert_video(file_path, output_file, None, progress_callback)  # Use convert_video for audio too
+                        self.ffmpeg.convert_video(file_path, output_file, None, progress_callback, media_info)  # Use convert_video for audio too
                         processing_needed = True
                         
             # Handle original file deletion
@@ -201,13 +253,17 @@ class MediaProcessor:
                 except Exception as e:
                     self.logger.warning(f"Could not delete original file: {str(e)}")
                     
-            return output_file
+            return output_files or [output_file]
             
         except Exception as e:
             self.logger.error(f"Error processing downloaded file: {str(e)}")
             # Return original file if processing failed
-            return file_path
+            return [file_path]
             
+    def reload_settings(self):
+        """Apply changed settings to running components"""
+        self.downloader.reload_settings()
+        
     def cleanup(self):
         """Cleanup resources"""
         try:
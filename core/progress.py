@@ -0,0 +1,122 @@
+"""
+Progress events reported by downloads and processing
+"""
+
+class DownloadProgress:
+    """Progress update for a running yt-dlp download"""
+    
+    __slots__ = ('status', 'downloaded_bytes', 'total_bytes', 'speed', 'eta',
+                 'fragment_index', 'fragment_count', 'filename', 'percent')
+                 
+    def __init__(self, status='downloading', downloaded_bytes=None, total_bytes=None,
+                 speed=None, eta=None, fragment_index=None, fragment_count=None,
+                 filename=None, percent=None):
+        self.status = status
+        self.downloaded_bytes = downloaded_bytes
+        self.total_bytes = total_bytes
+        self.speed = speed  # bytes per second
+        self.eta = eta  # seconds
+        self.fragment_index = fragment_index
+        self.fragment_count = fragment_count
+        self.filename = filename
+        self.percent = percent if percent is not None else self._compute_percent()
+        
+    @classmethod
+    def from_dict(cls, d):
+        """Create from a yt-dlp progress dictionary (progress hook or %(progress)j)"""
+        return cls(
+            status=d.get('status', 'downloading'),
+            downloaded_bytes=d.get('downloaded_bytes'),
+            total_bytes=d.get('total_bytes') or d.get('total_bytes_estimate'),
+            speed=d.get('speed'),
+            eta=d.get('eta'),
+            fragment_index=d.get('fragment_index'),
+            fragment_count=d.get('fragment_count'),
+            filename=d.get('filename')
+        )
+        
+    def _compute_percent(self):
+        """Percentage from byte counts, falling back to fragment counts for HLS/DASH"""
+        if self.total_bytes and self.downloaded_bytes is not None:
+            return min(self.downloaded_bytes * 100.0 / self.total_bytes, 100.0)
+            
+        if self.fragment_count and self.fragment_index is not None:
+            return min(self.fragment_index * 100.0 / self.fragment_count, 100.0)
+            
+        if self.status == 'finished':
+            return 100.0
+            
+        return None
+        
+    def __repr__(self):
+        return (f"DownloadProgress(status={self.status!r}, percent={self.percent}, "
+                f"downloaded_bytes={self.downloaded_bytes}, total_bytes={self.total_bytes}, "
+                f"speed={self.speed}, eta={self.eta})")
+
+class FFmpegProgress:
+    """Progress update parsed from one ffmpeg -progress block"""
+    
+    __slots__ = ('status', 'frame', 'fps', 'bitrate', 'total_size', 'out_time_us', 'speed', 'percent')
+    
+    def __init__(self, status='continue', frame=None, fps=None, bitrate=None,
+                 total_size=None, out_time_us=None, speed=None, duration=None):
+        self.status = status  # 'continue' or 'end'
+        self.frame = frame
+        self.fps = fps
+        self.bitrate = bitrate
+        self.total_size = total_size  # bytes written so far
+        self.out_time_us = out_time_us
+        self.speed = speed  # multiple of realtime, e.g. 2.5
+        self.percent = self._compute_percent(duration)
+        
+    @classmethod
+    def from_block(cls, block, duration=None):
+        """Create from the key=value pairs of one -progress block"""
+        # out_time_ms is also in microseconds; older builds only have that one
+        out_time_us = _parse_number(block.get('out_time_us', block.get('out_time_ms')), int)
+        speed = block.get('speed', '')
+        return cls(
+            status=block.get('progress', 'continue'),
+            frame=_parse_number(block.get('frame'), int),
+            fps=_parse_number(block.get('fps'), float),
+            bitrate=block.get('bitrate'),
+            total_size=_parse_number(block.get('total_size'), int),
+            out_time_us=out_time_us,
+            speed=_parse_number(speed.rstrip('x'), float),
+            duration=duration
+        )
+        
+    @property
+    def out_time(self):
+        """Output position in seconds"""
+        return self.out_time_us / 1000000 if self.out_time_us is not None else None
+        
+    def _compute_percent(self, duration):
+        """Percentage of the input duration processed so far"""
+        if self.status == 'end':
+            return 100.0
+        if duration and self.out_time_us is not None:
+            return max(0.0, min(self.out_time_us / 10000 / duration, 100.0))
+        return None
+        
+    def __repr__(self):
+        return (f"FFmpegProgress(status={self.status!r}, percent={self.percent}, "
+                f"out_time_us={self.out_time_us}, fps={self.fps}, speed={self.speed}, "
+                f"total_size={self.total_size})")
+
+def _parse_number(value, kind):
+    """Parse an ffmpeg progress value, which may be 'N/A'"""
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        return None
+
+def format_bytes(num_bytes):
+    """Format a byte count for display, e.g. 1.5 MiB"""
+    if num_bytes is None:
+        return ''
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if abs(num_bytes) < 1024:
+            return f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+    return f"{num_bytes:.1f} TiB"
@@ -0,0 +1,55 @@
+"""
+CPU thread budget shared between concurrent FFMPEG processes
+"""
+
+import itertools
+import os
+import threading
+
+class ThreadBudget:
+    """Divides a global CPU thread budget between running FFMPEG processes
+    
+    Each process gets an equal share of the budget, sized against how many
+    processes are expected to run at once, and never more than the threads
+    still free; when none are free it waits for a running process to finish.
+    A share is fixed for the life of its process, so threads freed by one
+    process go to the processes started after it (including the remaining
+    chunks of a chunked encode).
+    """
+    
+    def __init__(self, total_threads=None):
+        self.total_threads = max(1, total_threads or os.cpu_count() or 1)
+        self.allocations = {}
+        self.condition = threading.Condition()
+        self._job_ids = itertools.count()
+        
+    def acquire(self, expected_jobs=1):
+        """Reserve a share of the budget for one FFMPEG process; returns (job_id, threads)
+        
+        expected_jobs is how many processes the caller expects to run at once,
+        this one included.
+        """
+        with self.condition:
+            while self._free() < 1:
+                self.condition.wait()
+                
+            job_id = next(self._job_ids)
+            share = self.total_threads // max(len(self.allocations) + 1, expected_jobs)
+            threads = max(1, min(share, self._free()))
+            self.allocations[job_id] = threads
+            return job_id, threads
+            
+    def release(self, job_id):
+        """Return a process's share to the budget"""
+        with self.condition:
+            self.allocations.pop(job_id, None)
+            self.condition.notify_all()
+            
+    def active_jobs(self):
+        """Number of processes currently holding a share"""
+        with self.condition:
+            return len(self.allocations)
+            
+    def _free(self):
+        """Threads not held by any process; must hold the condition"""
+        return self.total_threads - sum(self.allocations.values())
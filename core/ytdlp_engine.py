@@ -0,0 +1,183 @@
+"""
+In-process yt-dlp engine using the YoutubeDL Python API
+"""
+
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from core.progress import DownloadProgress
+
+try:
+    import yt_dlp
+except ImportError:
+    yt_dlp = None
+
+class YTDLPEngine:
+    """Runs yt-dlp jobs on a persistent worker pool instead of forking processes
+    
+    Each worker thread keeps its own YoutubeDL instances (YoutubeDL is not
+    thread-safe), so loaded extractors and HTTP keep-alive connections are
+    reused across queue items that share the same options.
+    """
+    
+    # YoutubeDL instances kept per worker thread, keyed by their options
+    MAX_INSTANCES_PER_THREAD = 4
+    
+    # Options that change from job to job; they are applied to the cached
+    # instance for each call instead of being part of its cache key
+    JOB_OPTIONS = ('format', 'merge_output_format', 'concurrent_fragment_downloads')
+    
+    def __init__(self, logger, max_workers=2):
+        self.logger = logger
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='yt-dlp')
+        self._local = threading.local()
+        self._cancel_events = set()
+        self._lock = threading.Lock()
+        
+    @staticmethod
+    def is_available():
+        """Check if the yt_dlp package can be imported"""
+        return yt_dlp is not None
+        
+    def extract_info(self, url, ydl_opts=None, process=True):
+        """Extract media information without downloading"""
+        future = self.executor.submit(self._extract_info, url, dict(ydl_opts or {}), process)
+        return future.result()
+        
+    def download(self, url, ydl_opts, progress_callback=None, info=None, cancel_event=None):
+        """Download media from URL, or from previously extracted info, and return (info, output_files)
+        
+        Setting cancel_event stops the download at its next progress update.
+        """
+        cancel_event = cancel_event or threading.Event()
+        with self._lock:
+            self._cancel_events.add(cancel_event)
+            
+        try:
+            future = self.executor.submit(self._download, url, dict(ydl_opts), progress_callback, cancel_event, info)
+            return future.result()
+        finally:
+            with self._lock:
+                self._cancel_events.discard(cancel_event)
+                
+    def resize(self, max_workers):
+        """Change the number of worker threads; jobs already submitted finish on the old pool"""
+        with self._lock:
+            if max_workers == self.max_workers:
+                return
+            old_executor = self.executor
+            self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='yt-dlp')
+            self.max_workers = max_workers
+        old_executor.shutdown(wait=False)
+        
+    def shutdown(self):
+        """Cancel running downloads and stop the worker pool"""
+        with self._lock:
+            for cancel_event in self._cancel_events:
+                cancel_event.set()
+        self.executor.shutdown(wait=False)
+        
+    def _extract_info(self, url, ydl_opts, process):
+        """Worker-side metadata extraction"""
+        ydl = self._get_ydl(ydl_opts)
+        self._apply_job_options(ydl, ydl_opts)
+        self._local.job = None
+        info = ydl.extract_info(url, download=False, process=process)
+        return ydl.sanitize_info(info)
+        
+    def _download(self, url, ydl_opts, progress_callback, cancel_event, info=None):
+        """Worker-side download"""
+        ydl = self._get_ydl(ydl_opts)
+        self._apply_job_options(ydl, ydl_opts)
+        self._local.job = (progress_callback, cancel_event)
+        try:
+            if info is not None:
+                # Skip extraction and go straight to format selection
+                info = ydl.process_ie_result(info, download=True)
+            else:
+                info = ydl.extract_info(url, download=True)
+        finally:
+            self._local.job = None
+            
+        info = ydl.sanitize_info(info) or {}
+        return info, self._collect_filepaths(info)
+        
+    def _get_ydl(self, ydl_opts):
+        """Get a cached YoutubeDL for this worker thread and these options"""
+        instances = getattr(self._local, 'instances', None)
+        if instances is None:
+            instances = self._local.instances = OrderedDict()
+            
+        shared_opts = {key: value for key, value in ydl_opts.items() if key not in self.JOB_OPTIONS}
+        key = json.dumps(shared_opts, sort_keys=True, default=str)
+        ydl = instances.get(key)
+        if ydl is not None:
+            instances.move_to_end(key)
+            return ydl
+            
+        params = dict(shared_opts)
+        params.update({
+            'quiet': True,
+            'no_warnings': True,
+            'noprogress': True,
+            'logger': self.logger,
+            'progress_hooks': [self._progress_hook]
+        })
+        ydl = yt_dlp.YoutubeDL(params)
+        instances[key] = ydl
+        
+        # Drop the least recently used instance
+        if len(instances) > self.MAX_INSTANCES_PER_THREAD:
+            _, old_ydl = instances.popitem(last=False)
+            try:
+                old_ydl.close()
+            except Exception:
+                pass
+                
+        return ydl
+        
+    def _apply_job_options(self, ydl, ydl_opts):
+        """Set this job's format and download options on a cached YoutubeDL"""
+        for key in self.JOB_OPTIONS:
+            if key in ydl_opts:
+                ydl.params[key] = ydl_opts[key]
+            else:
+                ydl.params.pop(key, None)
+                
+        # YoutubeDL compiles the format spec once in its constructor
+        format_spec = ydl_opts.get('format')
+        if format_spec in (None, '-') or callable(format_spec):
+            ydl.format_selector = format_spec
+        else:
+            ydl.format_selector = ydl.build_format_selector(format_spec)
+            
+    def _progress_hook(self, d):
+        """Forward yt-dlp progress to the callback of the current job"""
+        job = getattr(self._local, 'job', None)
+        if not job:
+            return
+            
+        progress_callback, cancel_event = job
+        if cancel_event.is_set():
+            raise yt_dlp.utils.DownloadCancelled('Download cancelled')
+            
+        if progress_callback and d.get('status') == 'downloading':
+            progress_callback(DownloadProgress.from_dict(d))
+            
+    @classmethod
+    def _collect_filepaths(cls, info):
+        """Collect final file paths from a (possibly playlist) info dict"""
+        filepaths = []
+        for entry in info.get('entries') or []:
+            if entry:
+                filepaths.extend(cls._collect_filepaths(entry))
+                
+        for download in info.get('requested_downloads') or []:
+            filepath = download.get('filepath')
+            if filepath and filepath not in filepaths:
+                filepaths.append(filepath)
+                
+        return filepaths
@@ -0,0 +1,120 @@
+"""
+Event bus carrying updates from worker threads to the GUI thread
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+
+class Event:
+    """One event on the bus"""
+    
+    __slots__ = ('kind', 'item_id', 'data')
+    
+    def __init__(self, kind, item_id=None, data=None):
+        self.kind = kind  # 'progress', 'state', 'removed', 'log' or 'overflow'
+        self.item_id = item_id
+        self.data = data
+        
+    def __repr__(self):
+        return f"Event(kind={self.kind!r}, item_id={self.item_id!r})"
+
+class EventBus:
+    """Bounded, coalescing publish/subscribe queue between threads
+    
+    Workers publish from any thread; subscribers are called on the thread that
+    calls drain(). Pending events for the same item are merged, so an item
+    never occupies more than one slot, and progress events for an item are
+    delivered at most once per progress_interval. When the queue is full the
+    oldest item event is dropped and subscribers to 'overflow' are told how
+    many were lost, so they can resynchronize; surplus log lines are dropped
+    silently.
+    """
+    
+    def __init__(self, max_events=10000, max_log_lines=1000, progress_interval=0.2):
+        self.max_events = max_events
+        self.progress_interval = progress_interval
+        self.lock = threading.Lock()
+        self.pending = OrderedDict()  # item id -> Event
+        self.log_lines = deque(maxlen=max_log_lines)
+        self.subscribers = {}  # kind -> callbacks
+        self.last_progress = {}  # item id -> time of the last delivered progress event
+        self.dropped = 0
+        
+    def subscribe(self, kind, callback):
+        """Call callback(event) for every delivered event of a kind"""
+        self.subscribers.setdefault(kind, []).append(callback)
+        
+    def publish(self, kind, item_id=None, data=None):
+        """Post an event; never blocks on the consumer"""
+        with self.lock:
+            if item_id is None:
+                self.log_lines.append(Event(kind, data=data))
+                return
+                
+            event = self.pending.get(item_id)
+            if event is not None:
+                # Newer data replaces the pending event; a pending state
+                # change stays one, so it isn't held back by rate limiting
+                if event.kind == 'removed':
+                    return
+                if not (kind == 'progress' and event.kind == 'state'):
+                    event.kind = kind
+                event.data = data
+                return
+                
+            if len(self.pending) >= self.max_events:
+                self.pending.popitem(last=False)
+                self.dropped += 1
+            self.pending[item_id] = Event(kind, item_id, data)
+            
+    def drain(self, limit=500):
+        """Deliver up to limit events to subscribers on the calling thread
+        
+        Returns True if more events are ready to be delivered right away.
+        """
+        now = time.monotonic()
+        batch = []
+        deferred = []
+        with self.lock:
+            while self.log_lines and len(batch) < limit:
+                batch.append(self.log_lines.popleft())
+                
+            while self.pending and len(batch) < limit:
+                key, event = self.pending.popitem(last=False)
+                if event.kind == 'progress':
+                    # Rate limit per item; the event keeps its slot until due
+                    if now - self.last_progress.get(event.item_id, float('-inf')) < self.progress_interval:
+                        deferred.append((key, event))
+                        continue
+                    self.last_progress[event.item_id] = now
+                elif event.kind == 'removed':
+                    self.last_progress.pop(event.item_id, None)
+                batch.append(event)
+                
+            more = bool(self.pending or self.log_lines)
+            for key, event in deferred:
+                self.pending[key] = event
+                
+            if self.dropped:
+                batch.append(Event('overflow', data=self.dropped))
+                self.dropped = 0
+                
+        for event in batch:
+            for callback in self.subscribers.get(event.kind, ()):
+                callback(event)
+        return more
+
+class EventBusHandler(logging.Handler):
+    """Logging handler that publishes log lines as 'log' events"""
+    
+    def __init__(self, bus, level=logging.INFO):
+        super().__init__(level)
+        self.bus = bus
+        
+    def emit(self, record):
+        try:
+            self.bus.publish('log', data=self.format(record))
+        except Exception:
+            self.handleError(record)
@@ -0,0 +1,128 @@
+"""
+Priority queue of items waiting to be processed
+"""
+
+import itertools
+import time
+
+class JobQueue:
+    """Indexed binary heap of queued items, highest priority first, with aging
+    
+    Each priority level is worth aging_interval seconds of waiting, so an item's
+    sort key is its enqueue time minus priority * aging_interval. The key never
+    changes while the item waits, yet an old low-priority item still overtakes
+    newer high-priority ones once it has waited long enough. Not thread-safe;
+    callers hold the queue lock.
+    """
+    
+    def __init__(self, aging_interval=300):
+        self.aging_interval = aging_interval
+        self.heap = []
+        self.positions = {}  # item id -> index in heap
+        self._sequence = itertools.count()
+        
+    def push(self, item, enqueued_at=None):
+        """Add an item; enqueued_at defaults to now and only affects aging"""
+        item.enqueued_at = enqueued_at if enqueued_at is not None else time.time()
+        item.queue_sequence = next(self._sequence)
+        item.queue_key = self._key(item)
+        self.heap.append(item)
+        self.positions[item.id] = len(self.heap) - 1
+        self._sift_up(len(self.heap) - 1)
+        
+    def pop(self):
+        """Remove and return the item that should run next"""
+        if not self.heap:
+            raise IndexError("pop from an empty queue")
+        return self._remove_at(0)
+        
+    def peek(self):
+        """The item that should run next, without removing it"""
+        return self.heap[0] if self.heap else None
+        
+    def get(self, item_id):
+        """A queued item by id, or None"""
+        index = self.positions.get(item_id)
+        return self.heap[index] if index is not None else None
+        
+    def remove(self, item_id):
+        """Remove a queued item by id; returns it, or None if it isn't queued"""
+        index = self.positions.get(item_id)
+        if index is None:
+            return None
+        return self._remove_at(index)
+        
+    def reprioritize(self, item_id, priority):
+        """Change a queued item's priority in O(log n); returns False if it isn't queued"""
+        index = self.positions.get(item_id)
+        if index is None:
+            return False
+            
+        item = self.heap[index]
+        item.priority = priority
+        item.queue_key = self._key(item)
+        self._sift_up(index)
+        self._sift_down(self.positions[item_id])
+        return True
+        
+    def clear(self):
+        """Remove all items"""
+        self.heap.clear()
+        self.positions.clear()
+        
+    def __len__(self):
+        return len(self.heap)
+        
+    def __iter__(self):
+        """Iterate over queued items in no particular order"""
+        return iter(list(self.heap))
+        
+    def __contains__(self, item_id):
+        return item_id in self.positions
+        
+    def _key(self, item):
+        """Sort key; smaller runs first"""
+        return (item.enqueued_at - item.priority * self.aging_interval, item.queue_sequence)
+        
+    def _remove_at(self, index):
+        """Remove the item at a heap index"""
+        item = self.heap[index]
+        last = self.heap.pop()
+        del self.positions[item.id]
+        if index < len(self.heap):
+            self.heap[index] = last
+            self.positions[last.id] = index
+            self._sift_up(index)
+            self._sift_down(self.positions[last.id])
+        return item
+        
+    def _swap(self, i, j):
+        """Swap two heap entries and their recorded positions"""
+        heap = self.heap
+        heap[i], heap[j] = heap[j], heap[i]
+        self.positions[heap[i].id] = i
+        self.positions[heap[j].id] = j
+        
+    def _sift_up(self, index):
+        """Move an entry towards the root until its parent sorts before it"""
+        heap = self.heap
+        while index > 0:
+            parent = (index - 1) // 2
+            if heap[parent].queue_key <= heap[index].queue_key:
+                break
+            self._swap(index, parent)
+            index = parent
+            
+    def _sift_down(self, index):
+        """Move an entry towards the leaves until it sorts before its children"""
+        heap = self.heap
+        size = len(heap)
+        while True:
+            smallest = index
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < size and heap[child].queue_key < heap[smallest].queue_key:
+                    smallest = child
+            if smallest == index:
+                return
+            self._swap(index, smallest)
+            index = smallest
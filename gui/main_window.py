@@ -9,11 +9,24 @@ import os
 from datetime import datetime
 
 from gui.drag_drop import DragDropMixin
+from gui.event_bus import EventBusHandler
 from gui.queue_manager import QueueManager
+from gui.queue_model import QueueModel
 from gui.settings_dialog import SettingsDialog
 from core.processor import MediaProcessor
+from core.progress import format_bytes
 
 class MainWindow(DragDropMixin):
+    # Columns of the queue view, and the item fields they sort by
+    QUEUE_COLUMNS = ("URL/File", "Status", "Progress", "Output")
+    SORT_FIELDS = {"URL/File": 'source', "Status": 'status', "Progress": 'progress', "Output": 'output_file'}
+    
+    # Rows materialized beyond each edge of the visible part of the queue view
+    QUEUE_OVERSCAN = 10
+    
+    # How often the GUI looks for worker events when the bus has run dry
+    EVENT_POLL_MS = 50
+    
     def __init__(self, root, config, logger):
         self.root = root
         self.config = config
@@ -21,6 +34,25 @@ class MainWindow(DragDropMixin):
         self.processor = MediaProcessor(config, logger)
         self.queue_manager = QueueManager(self.processor)
         
+        # Queue view state: the model holds every item, the Treeview only a
+        # window of row slots around the visible rows, starting at window_start
+        self.queue_model = QueueModel()
+        self.view_top = 0  # Model index of the first visible row
+        self.visible_rows = 20
+        self.window_start = 0
+        self.slot_values = []  # Displayed values of each row slot
+        
+        # Worker events are drained on the Tk main loop and batched into one model update
+        self.pending_changes = self._empty_changes()
+        events = self.queue_manager.events
+        events.subscribe('state', self._on_item_event)
+        events.subscribe('progress', self._on_item_event)
+        events.subscribe('removed', self._on_item_removed)
+        events.subscribe('log', self._on_log_line)
+        events.subscribe('overflow', self._on_events_lost)
+        self.log_handler = EventBusHandler(events)
+        self.logger.addHandler(self.log_handler)
+        
         # Initialize drag and drop
         super().__init__(root)
         
@@ -80,29 +112,41 @@ class MainWindow(DragDropMixin):
         queue_frame = ttk.LabelFrame(main_frame, text="Processing Queue", padding="10")
         queue_frame.grid(row=2, column=0, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S))
         queue_frame.columnconfigure(0, weight=1)
-        queue_frame.rowconfigure(0, weight=1)
+        queue_frame.rowconfigure(1, weight=1)
+        
+        # Status filter
+        filter_frame = ttk.Frame(queue_frame)
+        filter_frame.grid(row=0, column=0, columnspan=2, sticky=tk.W, pady=(0, 5))
+        ttk.Label(filter_frame, text="Show:").pack(side=tk.LEFT)
+        self.status_filter_var = tk.StringVar(value="All")
+        status_filter = ttk.Combobox(filter_frame, textvariable=self.status_filter_var, width=12, state="readonly",
+                                     values=["All", "queued", "processing", "completed", "error"])
+        status_filter.pack(side=tk.LEFT, padx=(5, 0))
+        status_filter.bind("<<ComboboxSelected>>", lambda e: self._filter_queue())
 
-        # Create treeview for queue
-        columns = ("URL/File", "Status", "Progress", "Output")
-        self.queue_tree = ttk.Treeview(queue_frame, columns=columns, show="headings")
+        # Create treeview for queue; it only holds the rows around the visible ones
+        self.queue_tree = ttk.Treeview(queue_frame, columns=self.QUEUE_COLUMNS, show="headings")
 
-        self.queue_tree.heading("URL/File", text="URL/File")
+        for column in self.QUEUE_COLUMNS:
+            self.queue_tree.heading(column, text=column, command=lambda c=column: self._sort_queue(c))
         self.queue_tree.column("URL/File", width=300)
-        self.queue_tree.heading("Status", text="Status")
         self.queue_tree.column("Status", width=100, anchor="center")
-        self.queue_tree.heading("Progress", text="Progress")
-        self.queue_tree.column("Progress", width=100, anchor="center")
-        self.queue_tree.heading("Output", text="Output")
+        self.queue_tree.column("Progress", width=180, anchor="center")
         self.queue_tree.column("Output", width=200)
 
-        # Scrollbars
-        v_scroll = ttk.Scrollbar(queue_frame, orient="vertical", command=self.queue_tree.yview)
+        # Scrollbars; the vertical one scrolls the model, not the Treeview
+        self.queue_scroll = ttk.Scrollbar(queue_frame, orient="vertical", command=self._scroll_queue)
         h_scroll = ttk.Scrollbar(queue_frame, orient="horizontal", command=self.queue_tree.xview)
-        self.queue_tree.configure(yscrollcommand=v_scroll.set, xscrollcommand=h_scroll.set)
+        self.queue_tree.configure(xscrollcommand=h_scroll.set)
+        
+        self.queue_tree.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.queue_scroll.grid(row=1, column=1, sticky=(tk.N, tk.S))
+        h_scroll.grid(row=2, column=0, sticky=(tk.W, tk.E))
 
-        self.queue_tree.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
-        v_scroll.grid(row=0, column=1, sticky=(tk.N, tk.S))
-        h_scroll.grid(row=1, column=0, sticky=(tk.W, tk.E))
+        self.queue_tree.bind("<Configure>", self._resize_queue)
+        self.queue_tree.bind("<MouseWheel>", lambda e: self._scroll_queue('scroll', -3 if e.delta > 0 else 3, 'units'))
+        self.queue_tree.bind("<Button-4>", lambda e: self._scroll_queue('scroll', -3, 'units'))
+        self.queue_tree.bind("<Button-5>", lambda e: self._scroll_queue('scroll', 3, 'units'))
 
         # Control buttons
         control_frame = ttk.Frame(main_frame, padding=(0, 10, 0, 0))
@@ -125,8 +169,12 @@ class MainWindow(DragDropMixin):
         self.status_var.set("Ready")
         status_bar = ttk.Label(status_bar_frame, textvariable=self.status_var)
         status_bar.pack(side=tk.LEFT, padx=5)
+        
+        self.log_var = tk.StringVar()
+        log_label = ttk.Label(status_bar_frame, textvariable=self.log_var)
+        log_label.pack(side=tk.RIGHT, padx=5)
 
-        # Start UI update timer
+        # Start draining worker events
         self.update_ui()
         
     def setup_menu(self):
@@ -206,7 +254,7 @@ class MainWindow(DragDropMixin):
             
     def open_settings(self):
         """Open settings dialog"""
-        dialog = SettingsDialog(self.root, self.config)
+        dialog = SettingsDialog(self.root, self.config, on_apply=self.queue_manager.reload_settings)
         
     def show_about(self):
         """Show about dialog"""
@@ -216,34 +264,143 @@ class MainWindow(DragDropMixin):
             "with support for yt-dlp and FFMPEG.")
             
     def update_ui(self):
-        """Update UI with current queue status"""
+        """Deliver pending worker events and update the UI with them"""
+        more = False
         try:
-            # Clear existing items
-            for item in self.queue_tree.get_children():
-                self.queue_tree.delete(item)
-                
-            # Add current queue items
-            for item in self.queue_manager.get_queue_items():
-                self.queue_tree.insert("", "end", values=(
-                    item.get('source', ''),
-                    item.get('status', ''),
-                    f"{item.get('progress', 0):.1f}%",
-                    item.get('output_file', '')
-                ))
-                
-            # Update status
-            active_count = len([item for item in self.queue_manager.get_queue_items() 
-                              if item.get('status') == 'processing'])
-            if active_count > 0:
-                self.status_var.set(f"Processing {active_count} item(s)...")
-            else:
-                self.status_var.set("Ready")
+            more = self.queue_manager.events.drain()
+            changes, self.pending_changes = self.pending_changes, self._empty_changes()
+            if changes['changed'] or changes['removed'] or changes['reset']:
+                self.queue_model.apply(changes)
+                self._render_queue()
                 
+                # Update status
+                active_count = self.queue_model.status_counts.get('processing', 0)
+                if active_count > 0:
+                    self.status_var.set(f"Processing {active_count} item(s)...")
+                else:
+                    self.status_var.set("Ready")
+                    
         except Exception as e:
             self.logger.error(f"Error updating UI: {str(e)}")
             
-        # Schedule next update
-        self.root.after(1000, self.update_ui)
+        # Keep draining between redraws while events are ready, else check back shortly
+        if more:
+            self.root.after_idle(self.update_ui)
+        else:
+            self.root.after(self.EVENT_POLL_MS, self.root.after_idle, self.update_ui)
+            
+    def _empty_changes(self):
+        """A model update with no changes"""
+        return {'changed': [], 'removed': [], 'reset': False}
+        
+    def _on_item_event(self, event):
+        """Queue an item's new state for the next model update"""
+        self.pending_changes['changed'].append(event.data)
+        
+    def _on_item_removed(self, event):
+        """Queue an item's removal for the next model update"""
+        self.pending_changes['removed'].append(event.item_id)
+        
+    def _on_log_line(self, event):
+        """Show the latest log line in the status bar"""
+        self.log_var.set(event.data)
+        
+    def _on_events_lost(self, event):
+        """Resynchronize the whole model after the event bus dropped events"""
+        changes = self.queue_manager.get_changes()
+        changes['reset'] = True
+        self.pending_changes = changes
+        
+    def _render_queue(self):
+        """Fill the Treeview's row slots from the model, touching only changed cells"""
+        total = len(self.queue_model)
+        self.view_top = max(0, min(self.view_top, total - self.visible_rows))
+        
+        # Move the materialized window only when the visible rows leave it
+        window = self.visible_rows + 2 * self.QUEUE_OVERSCAN
+        if not (self.window_start <= self.view_top and
+                self.view_top + self.visible_rows <= self.window_start + window):
+            self.window_start = max(0, self.view_top - self.QUEUE_OVERSCAN)
+        count = max(0, min(window, total - self.window_start))
+        
+        # Add or drop row slots to match
+        while len(self.slot_values) < count:
+            self.queue_tree.insert("", "end", iid=f"slot{len(self.slot_values)}", values=())
+            self.slot_values.append(None)
+        while len(self.slot_values) > count:
+            self.slot_values.pop()
+            self.queue_tree.delete(f"slot{len(self.slot_values)}")
+            
+        for slot in range(count):
+            item = self.queue_model.row(self.window_start + slot)
+            values = (
+                item.get('source', ''),
+                item.get('status', ''),
+                self._format_progress(item),
+                item.get('output_file', '')
+            )
+            old_values = self.slot_values[slot]
+            if old_values is None:
+                self.queue_tree.item(f"slot{slot}", values=values)
+            elif old_values != values:
+                for column, old, new in zip(self.QUEUE_COLUMNS, old_values, values):
+                    if old != new:
+                        self.queue_tree.set(f"slot{slot}", column, new)
+            self.slot_values[slot] = values
+            
+        # Show the visible rows and size the scrollbar to the whole model
+        if count:
+            self.queue_tree.yview_moveto((self.view_top - self.window_start) / count)
+        if total:
+            self.queue_scroll.set(self.view_top / total, min(1.0, (self.view_top + self.visible_rows) / total))
+        else:
+            self.queue_scroll.set(0.0, 1.0)
+            
+    def _scroll_queue(self, *args):
+        """Scrollbar and mouse wheel handler for the queue view"""
+        if args[0] == 'moveto':
+            self.view_top = int(float(args[1]) * len(self.queue_model))
+        elif args[0] == 'scroll':
+            amount = int(args[1])
+            if args[2] == 'pages':
+                amount *= self.visible_rows
+            self.view_top += amount
+        self._render_queue()
+        return "break"
+        
+    def _resize_queue(self, event):
+        """Recompute how many rows fit in the queue view"""
+        row_height = int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+        visible_rows = max(1, (event.height - row_height) // row_height)  # Less the heading
+        if visible_rows != self.visible_rows:
+            self.visible_rows = visible_rows
+            self._render_queue()
+            
+    def _sort_queue(self, column):
+        """Sort the queue view by a column, toggling the direction on repeat clicks"""
+        field = self.SORT_FIELDS[column]
+        descending = field == self.queue_model.sort_field and not self.queue_model.descending
+        self.queue_model.set_sort(field, descending)
+        self.view_top = 0
+        self._render_queue()
+        
+    def _filter_queue(self):
+        """Show only items with the selected status"""
+        status = self.status_filter_var.get()
+        self.queue_model.set_filter(None if status == "All" else status)
+        self.view_top = 0
+        self._render_queue()
+        
+    def _format_progress(self, item):
+        """Format the progress cell, with throughput while downloading"""
+        text = f"{item.get('progress', 0):.1f}%"
+        if item.get('status') == 'processing' and item.get('speed'):
+            text += f" ({format_bytes(item['speed'])}/s"
+            if item.get('eta') is not None:
+                minutes, seconds = divmod(int(item['eta']), 60)
+                text += f", ETA {minutes}:{seconds:02d}"
+            text += ")"
+        return text
         
     def on_closing(self):
         """Handle window closing"""
@@ -254,6 +411,7 @@ class MainWindow(DragDropMixin):
     def cleanup(self):
         """Cleanup resources"""
         try:
+            self.logger.removeHandler(self.log_handler)
             self.queue_manager.stop()
             self.processor.cleanup()
         except Exception as e:
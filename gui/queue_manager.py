@@ -3,27 +3,52 @@ Queue Manager for handling media processing tasks
 """
 
 import threading
-import time
+from collections import OrderedDict
 from datetime import datetime
-from collections import deque
 import uuid
 
+from core.job_store import JobStore
+from gui.event_bus import EventBus
+from gui.job_queue import JobQueue
+from gui.stage_pool import StagePool
+
 class QueueItem:
     """Represents a single item in the processing queue"""
     
-    def __init__(self, source, item_type, options=None):
+    def __init__(self, source, item_type, options=None, parent_id=None, priority=0):
         self.id = str(uuid.uuid4())
         self.source = source
         self.type = item_type  # "url" or "file"
         self.options = options or {}
+        self.priority = priority  # Higher runs sooner
+        self.enqueued_at = None  # Queue position state, set by JobQueue
+        self.queue_sequence = None
+        self.queue_key = None
         self.status = "queued"  # queued, processing, completed, error
+        self.stage = None  # probe, download, process or finalize while in the pipeline
         self.progress = 0.0
+        self.speed = None  # Download throughput in bytes per second
+        self.eta = None
+        self.downloaded_bytes = None
+        self.total_bytes = None
         self.error_message = ""
         self.output_file = ""
         self.created_at = datetime.now()
         self.started_at = None
         self.completed_at = None
         
+        # Hand-off state between pipeline stages
+        self.info = None
+        self.download_result = None
+        self.result = None
+        self.holds_slot = False
+        
+        # Playlist fan-out: children point at their parent, which tracks them
+        self.parent_id = parent_id
+        self.child_progress = {}
+        self.pending_children = 0
+        self.failed_children = 0
+        
     def to_dict(self):
         """Convert to dictionary for UI display"""
         return {
@@ -31,37 +56,193 @@ class QueueItem:
             'source': self.source,
             'type': self.type,
             'status': self.status,
+            'stage': self.stage,
+            'priority': self.priority,
             'progress': self.progress,
+            'speed': self.speed,
+            'eta': self.eta,
+            'downloaded_bytes': self.downloaded_bytes,
+            'total_bytes': self.total_bytes,
             'error_message': self.error_message,
             'output_file': self.output_file,
             'created_at': self.created_at,
             'started_at': self.started_at,
-            'completed_at': self.completed_at
+            'completed_at': self.completed_at,
+            'parent_id': self.parent_id,
+            'children': len(self.child_progress)
+        }
+        
+    def to_record(self):
+        """Convert to a job store record"""
+        return {
+            'id': self.id,
+            'parent_id': self.parent_id,
+            'source': self.source,
+            'type': self.type,
+            'options': self.options,
+            'status': self.status,
+            'priority': self.priority,
+            'progress': self.progress,
+            'error_message': self.error_message,
+            'output_file': self.output_file,
+            'created_at': self.created_at.timestamp(),
+            'started_at': self.started_at.timestamp() if self.started_at else None,
+            'completed_at': self.completed_at.timestamp() if self.completed_at else None
         }
+        
+    @classmethod
+    def from_record(cls, record):
+        """Recreate an item from a job store record, keeping its id"""
+        item = cls(record['source'], record['type'], record['options'], record['parent_id'], record['priority'])
+        item.id = record['id']
+        item.status = record['status']
+        item.progress = record['progress']
+        item.error_message = record['error_message']
+        item.output_file = record['output_file']
+        item.created_at = datetime.fromtimestamp(record['created_at'])
+        return item
 
 class QueueManager:
     """Manages the processing queue for media items"""
     
+    # Removed items remembered by the change feed before the oldest are dropped
+    MAX_TOMBSTONES = 10000
+    
     def __init__(self, processor):
         self.processor = processor
-        self.queue = deque()
+        self.queue = JobQueue(processor.config.getint('processing', 'priority_aging', fallback=300))
         self.processing_items = {}
+        self.playlist_items = {}  # Expanded playlists waiting on their children
         self.completed_items = []
         self.error_items = []
         
         self.running = True
         self.queue_lock = threading.Lock()
-        self.max_concurrent = 2  # Maximum concurrent processing tasks
+        # Signalled whenever an item is queued or an admission slot frees up
+        self.queue_changed = threading.Condition(self.queue_lock)
+        self.max_concurrent = self._stage_workers('max_concurrent')  # Maximum items probing or downloading at once
+        self.active_slots = 0
         
-    def add_item(self, source, item_type, options=None):
-        """Add item to processing queue"""
-        item = QueueItem(source, item_type, options)
+        # Change feed: the revision of each item's latest change, oldest first.
+        # It has its own lock so progress updates don't contend with the queue
+        self.changes_lock = threading.Lock()
+        self.revision = 0
+        self.changes = OrderedDict()  # item id -> revision
+        self.tracked_items = {}  # item id -> item, for items not cleared
+        self.oldest_revision = 0  # Removals up to this revision have been forgotten
         
-        with self.queue_lock:
-            self.queue.append(item)
+        # Changes are also pushed to the GUI thread as events
+        self.events = EventBus()
+        
+        # Pipeline stages, each with its own workers; an item holds one of the
+        # max_concurrent slots only until it leaves the network-bound stages
+        logger = self.processor.logger
+        self.finalize_pool = StagePool('finalize', self._finalize_item, self._stage_workers('finalize_workers'), logger,
+                                       capacity=0)
+        self.process_pool = StagePool('process', self._process_stage, self._stage_workers('process_workers'), logger)
+        self.download_pool = StagePool('download', self._download_stage, self._stage_workers('download_workers'), logger)
+        self.probe_pool = StagePool('probe', self._probe_stage, self._stage_workers('probe_workers'), logger)
+        
+        # Journal of item states so unfinished work survives a restart
+        self.job_store = None
+        if self.processor.config.getboolean('advanced', 'persistent_queue', fallback=True):
+            try:
+                self.job_store = JobStore(self.processor.logger)
+                self._restore_jobs()
+            except Exception as e:
+                self.processor.logger.warning(f"Could not open queue journal: {str(e)}")
+                
+    def _stage_workers(self, key):
+        """Read a concurrency setting from the [processing] section"""
+        config = self.processor.config
+        if key in ('probe_workers', 'download_workers') and not config.getint('processing', key, fallback=0):
+            # Network-bound stages follow max_concurrent unless set explicitly
+            key = 'max_concurrent'
+        fallback = 1 if key == 'finalize_workers' else 2
+        return max(1, config.getint('processing', key, fallback=fallback))
+        
+    def reload_settings(self):
+        """Apply changed concurrency settings to the running pipeline"""
+        self.probe_pool.resize(self._stage_workers('probe_workers'))
+        self.download_pool.resize(self._stage_workers('download_workers'))
+        self.process_pool.resize(self._stage_workers('process_workers'))
+        self.finalize_pool.resize(self._stage_workers('finalize_workers'))
+        
+        with self.queue_changed:
+            self.max_concurrent = self._stage_workers('max_concurrent')
+            self.queue_changed.notify()
+            
+        self.processor.reload_settings()
+        
+    def add_item(self, source, item_type, options=None, priority=0):
+        """Add item to processing queue; higher priorities are started first"""
+        item = QueueItem(source, item_type, options, priority=priority)
+        
+        with self.queue_changed:
+            self.queue.push(item)
+            self.queue_changed.notify()
+        self._journal(item)
             
         return item.id
         
+    def set_priority(self, item_id, priority):
+        """Change the priority of a queued item; returns False if it isn't queued"""
+        with self.queue_lock:
+            item = self.queue.get(item_id)
+            if item is None:
+                return False
+            self.queue.reprioritize(item_id, priority)
+        self._journal(item)
+        return True
+        
+    def _journal(self, *items):
+        """Record a state transition of items in the change feed and the job store"""
+        self._touch(*items)
+        if self.job_store:
+            for item in items:
+                self.job_store.record(item.to_record())
+                
+    def _restore_jobs(self):
+        """Requeue the items the previous run left queued or processing"""
+        restored = 0
+        for record in self.job_store.load_unfinished():
+            item = QueueItem.from_record(record)
+            
+            # Expanded playlists wait on their entries instead of expanding again
+            if item.type == "url" and item.parent_id is None:
+                children = self.job_store.load_children(item.id)
+                if children:
+                    self._restore_playlist(item, children)
+                    continue
+                    
+            # Interrupted downloads pick up their .part files when they run again
+            item.status = "queued"
+            item.progress = 0.0
+            self.queue.push(item, item.created_at.timestamp())
+            self._touch(item)
+            restored += 1
+            
+        if restored:
+            self.processor.logger.info(f"Restored {restored} unfinished queue item(s)")
+            
+    def _restore_playlist(self, parent, children):
+        """Rebuild a playlist's tracking of its entries from the journal"""
+        finished = ('completed', 'error')
+        parent.status = "processing"
+        parent.child_progress = {
+            child['id']: 100.0 if child['status'] in finished else 0.0
+            for child in children
+        }
+        parent.pending_children = sum(1 for child in children if child['status'] not in finished)
+        parent.failed_children = sum(1 for child in children if child['status'] == 'error')
+        parent.progress = sum(parent.child_progress.values()) / len(parent.child_progress)
+        
+        if parent.pending_children:
+            self.playlist_items[parent.id] = parent
+            self._touch(parent)
+        else:
+            self._complete_playlist(parent)
+            
     def get_queue_items(self):
         """Get all queue items for UI display"""
         items = []
@@ -75,6 +256,10 @@ class QueueManager:
             for item in self.processing_items.values():
                 items.append(item.to_dict())
                 
+            # Add playlists whose entries are still being processed
+            for item in self.playlist_items.values():
+                items.append(item.to_dict())
+                
             # Add completed items (last 50)
             for item in self.completed_items[-50:]:
                 items.append(item.to_dict())
@@ -88,102 +273,347 @@ class QueueManager:
     def clear_completed(self):
         """Clear completed items from display"""
         with self.queue_lock:
+            cleared = [item.id for item in self.completed_items]
             self.completed_items.clear()
+        self._forget(cleared)
+        if self.job_store:
+            self.job_store.delete(cleared)
             
     def clear_all(self):
         """Clear all items from queue"""
         with self.queue_lock:
+            # Removed playlist entries count as failed for their parent
+            for item in self.queue:
+                if item.parent_id:
+                    item.status = "error"
+                    item.error_message = "Removed from queue"
+                    self._finish_child(item)
+            cleared = [item.id for item in self.queue]
+            cleared += [item.id for item in self.completed_items + self.error_items]
             self.queue.clear()
             self.completed_items.clear()
             self.error_items.clear()
             # Note: Cannot clear currently processing items
             
+        self._forget(cleared)
+        if self.job_store:
+            self.job_store.delete(cleared)
+            
     def process_queue(self):
-        """Main queue processing loop"""
-        while self.running:
-            try:
-                # Check if we can start a new task
-                if len(self.processing_items) < self.max_concurrent:
-                    with self.queue_lock:
-                        if self.queue:
-                            item = self.queue.popleft()
-                            self.processing_items[item.id] = item
-                            
-                    if 'item' in locals():
-                        # Start processing in a separate thread
-                        thread = threading.Thread(
-                            target=self._process_item, 
-                            args=(item,), 
-                            daemon=True
-                        )
-                        thread.start()
-                        
-                time.sleep(0.5)  # Small delay to prevent busy waiting
-                
-            except Exception as e:
-                print(f"Error in queue processing: {e}")
-                time.sleep(1)
+        """Main dispatch loop: admits queued items into the pipeline as slots free up"""
+        while True:
+            with self.queue_changed:
+                while self.running and not (self.queue and self.active_slots < self.max_concurrent):
+                    self.queue_changed.wait()
+                if not self.running:
+                    return
+                    
+                item = self.queue.pop()
+                item.holds_slot = True
+                self.active_slots += 1
+                self.processing_items[item.id] = item
                 
-    def _process_item(self, item):
-        """Process a single queue item"""
+            # Outside the lock: waits while the probe stage is backed up
+            self.probe_pool.submit(item)
+            
+    def _probe_stage(self, item):
+        """Expand playlists and gather metadata, then hand off to download or processing"""
         try:
+            item.stage = "probe"
             item.status = "processing"
             item.started_at = datetime.now()
+            self._journal(item)
             
-            # Create progress callback
-            def progress_callback(progress):
-                item.progress = progress
-                
-            # Process the item based on type
             if item.type == "url":
-                result = self.processor.process_url(
-                    item.source, 
-                    item.options, 
-                    progress_callback
-                )
+                # Expand playlists into independently scheduled entries
+                if item.parent_id is None and self._expand_playlists():
+                    entries, item.info = self.processor.expand_playlist(item.source)
+                    if entries is not None:
+                        if not entries:
+                            raise Exception("Playlist is empty")
+                        self._fan_out(item, entries)
+                        return
+                self.download_pool.submit(item)
             elif item.type == "file":
-                result = self.processor.process_file(
-                    item.source, 
-                    item.options, 
-                    progress_callback
-                )
+                item.info = self.processor.probe_file(item.source)
+                self._release_slot(item)
+                self.process_pool.submit(item)
             else:
                 raise ValueError(f"Unknown item type: {item.type}")
                 
+        except Exception as e:
+            self._fail(item, e)
+            
+    def _download_stage(self, item):
+        """Download a URL item, then hand it to the processing stage"""
+        try:
+            item.stage = "download"
+            self._touch(item)
+            item.download_result = self.processor.download_url(
+                item.source,
+                item.options,
+                self._progress_callback(item),
+                item.info
+            )
+            
+            # Free the slot before waiting for room in the processing stage
+            self._release_slot(item)
+            self.process_pool.submit(item)
+            
+        except Exception as e:
+            self._fail(item, e)
+            
+    def _process_stage(self, item):
+        """Run FFMPEG processing for a downloaded URL or a local file"""
+        try:
+            item.stage = "process"
+            self._touch(item)
+            progress_callback = self._progress_callback(item)
+            if item.type == "url":
+                item.result = self.processor.process_downloads(
+                    item.source,
+                    item.download_result,
+                    item.options,
+                    progress_callback
+                )
+            else:
+                item.result = self.processor.process_file(
+                    item.source,
+                    item.options,
+                    progress_callback,
+                    item.info
+                )
+            self.finalize_pool.submit(item)
+            
+        except Exception as e:
+            self._fail(item, e)
+            
+    def _finalize_item(self, item):
+        """Record the outcome of an item that left the pipeline"""
+        item.stage = "finalize"
+        item.speed = item.eta = None
+        item.completed_at = datetime.now()
+        if item.status != "error":
             # Update item with results
             item.status = "completed"
             item.progress = 100.0
-            item.output_file = result.get('output_file', '')
-            item.completed_at = datetime.now()
+            item.output_file = item.result.get('output_file', '')
             
-            # Move to completed items
-            with self.queue_lock:
-                if item.id in self.processing_items:
-                    del self.processing_items[item.id]
+        # Release stage hand-off state
+        item.stage = None
+        item.info = item.download_result = item.result = None
+        
+        # Move to completed or error items
+        with self.queue_lock:
+            if item.id in self.processing_items:
+                del self.processing_items[item.id]
+            if item.status == "error":
+                self.error_items.append(item)
+            else:
                 self.completed_items.append(item)
+            if item.parent_id:
+                self._finish_child(item)
+        self._journal(item)
                 
-        except Exception as e:
-            # Handle processing error
-            item.status = "error"
-            item.error_message = str(e)
-            item.completed_at = datetime.now()
-            
-            # Move to error items
-            with self.queue_lock:
-                if item.id in self.processing_items:
-                    del self.processing_items[item.id]
-                self.error_items.append(item)
+    def _fail(self, item, error):
+        """Send an item that failed in any stage straight to finalization"""
+        item.status = "error"
+        item.error_message = str(error)
+        self._release_slot(item)
+        self.finalize_pool.submit(item)
+        
+    def _release_slot(self, item):
+        """Give back the admission slot an item holds, if it still has one"""
+        with self.queue_changed:
+            if item.holds_slot:
+                item.holds_slot = False
+                self.active_slots -= 1
+                self.queue_changed.notify()
+                
+    def _progress_callback(self, item):
+        """Create the progress callback for an item"""
+        def progress_callback(progress, details=None):
+            # FFMPEG reports no percentage when the input's duration is unknown
+            if progress is not None:
+                if item.parent_id:
+                    self._set_child_progress(item, progress)
+                item.progress = progress
+            
+            # Throughput is only known while downloading
+            if details is not None and details.status == 'downloading':
+                item.speed = details.speed
+                item.eta = details.eta
+                item.downloaded_bytes = details.downloaded_bytes
+                item.total_bytes = details.total_bytes
+            else:
+                item.speed = item.eta = None
+            self._touch(item, kind='progress')
                 
+        return progress_callback
+        
+    def _expand_playlists(self):
+        """Check whether playlist URLs should be fanned out into entries"""
+        return self.processor.config.getboolean('processing', 'expand_playlists', fallback=True)
+        
+    def _fan_out(self, parent, entries):
+        """Queue playlist entries as child items ahead of other queued items"""
+        children = [
+            QueueItem(entry['url'], "url", dict(parent.options), parent_id=parent.id, priority=parent.priority)
+            for entry in entries
+        ]
+        
+        with self.queue_changed:
+            parent.child_progress = {child.id: 0.0 for child in children}
+            parent.pending_children = len(children)
+            parent.progress = 0.0
+            
+            # The parent no longer holds a processing slot
+            if parent.holds_slot:
+                parent.holds_slot = False
+                self.active_slots -= 1
+            parent.stage = None
+            if parent.id in self.processing_items:
+                del self.processing_items[parent.id]
+            self.playlist_items[parent.id] = parent
+            # Entries take the playlist's place in the queue, in playlist order
+            for child in children:
+                self.queue.push(child, parent.enqueued_at)
+            self.queue_changed.notify()
+        self._journal(parent, *children)
+            
+    def _set_child_progress(self, child, progress):
+        """Update a playlist's aggregate progress from one of its entries"""
+        with self.queue_lock:
+            parent = self.playlist_items.get(child.parent_id)
+            if parent and child.id in parent.child_progress:
+                old = parent.child_progress[child.id]
+                parent.child_progress[child.id] = progress
+                parent.progress += (progress - old) / len(parent.child_progress)
+                self._touch(parent, kind='progress')
+                
+    def _finish_child(self, child):
+        """Account for a finished playlist entry; must hold queue_lock"""
+        parent = self.playlist_items.get(child.parent_id)
+        if not parent or child.id not in parent.child_progress:
+            return
+            
+        # Finished entries count as fully progressed, whatever the outcome
+        old = parent.child_progress[child.id]
+        parent.child_progress[child.id] = 100.0
+        parent.progress += (100.0 - old) / len(parent.child_progress)
+        
+        parent.pending_children -= 1
+        if child.status == "error":
+            parent.failed_children += 1
+            
+        if parent.pending_children > 0:
+            self._touch(parent)
+            return
+            
+        self._complete_playlist(parent)
+        
+    def _complete_playlist(self, parent):
+        """Finish a playlist whose entries are all done; must hold queue_lock"""
+        self.playlist_items.pop(parent.id, None)
+        total = len(parent.child_progress)
+        parent.progress = 100.0
+        parent.completed_at = datetime.now()
+        
+        if parent.failed_children == total:
+            parent.status = "error"
+            parent.error_message = f"All {total} playlist entries failed"
+            self.error_items.append(parent)
+        else:
+            parent.status = "completed"
+            if parent.failed_children:
+                parent.error_message = f"{parent.failed_children} of {total} playlist entries failed"
+            self.completed_items.append(parent)
+        self._journal(parent)
+                
+    def _touch(self, *items, kind='state'):
+        """Record a change to items in the change feed and publish it; kind is 'state' or 'progress'"""
+        with self.changes_lock:
+            for item in items:
+                self.revision += 1
+                self.changes[item.id] = self.revision
+                self.changes.move_to_end(item.id)
+                self.tracked_items[item.id] = item
+                
+        for item in items:
+            self.events.publish(kind, item.id, item.to_dict())
+            
+    def _forget(self, item_ids):
+        """Record the removal of items in the change feed and publish it"""
+        removed = []
+        with self.changes_lock:
+            for item_id in item_ids:
+                if self.tracked_items.pop(item_id, None) is None:
+                    continue
+                self.revision += 1
+                self.changes[item_id] = self.revision
+                self.changes.move_to_end(item_id)
+                removed.append(item_id)
+                
+            # Drop the oldest removals; consumers that are further behind get a reset
+            excess = len(self.changes) - len(self.tracked_items) - self.MAX_TOMBSTONES
+            if excess > self.MAX_TOMBSTONES:
+                for item_id, revision in list(self.changes.items()):
+                    if excess <= 0:
+                        break
+                    if item_id not in self.tracked_items:
+                        del self.changes[item_id]
+                        self.oldest_revision = max(self.oldest_revision, revision)
+                        excess -= 1
+                        
+        for item_id in removed:
+            self.events.publish('removed', item_id)
+            
+    def get_changes(self, since_revision=0):
+        """Items changed since a revision of the change feed
+        
+        Returns a dict with the current 'revision', 'changed' item dicts,
+        'removed' item ids, and 'reset', which is True when since_revision is
+        too old to answer and 'changed' holds every item instead.
+        """
+        with self.changes_lock:
+            changed = []
+            removed = []
+            reset = since_revision < self.oldest_revision
+            if reset:
+                changed = [item.to_dict() for item in self.tracked_items.values()]
+            else:
+                for item_id, revision in reversed(self.changes.items()):
+                    if revision <= since_revision:
+                        break
+                    item = self.tracked_items.get(item_id)
+                    if item is None:
+                        removed.append(item_id)
+                    else:
+                        changed.append(item.to_dict())
+                        
+            return {
+                'revision': self.revision,
+                'changed': changed,
+                'removed': removed,
+                'reset': reset
+            }
+            
     def stop(self):
         """Stop the queue manager"""
-        self.running = False
+        with self.queue_changed:
+            self.running = False
+            self.queue_changed.notify_all()
+        for pool in (self.probe_pool, self.download_pool, self.process_pool, self.finalize_pool):
+            pool.stop()
+        if self.job_store:
+            self.job_store.close()
         
     def get_stats(self):
         """Get queue statistics"""
         with self.queue_lock:
             return {
                 'queued': len(self.queue),
-                'processing': len(self.processing_items),
+                'processing': len(self.processing_items) + len(self.playlist_items),
                 'completed': len(self.completed_items),
                 'errors': len(self.error_items)
             }
@@ -0,0 +1,113 @@
+"""
+Backing model for the virtualized queue view
+"""
+
+from bisect import bisect_left, insort
+
+class QueueModel:
+    """Sorted and filtered queue items fed by QueueManager change deltas
+    
+    Items are kept in a list of sort keys, so applying a change, and looking
+    up the row at an index, stays cheap however many items there are.
+    """
+    
+    def __init__(self):
+        self.items = {}  # item id -> item dict
+        self.item_keys = {}  # item id -> sort key, for items passing the filter
+        self.keys = []  # ascending sort keys of the items passing the filter
+        self.status_counts = {}  # status -> number of items, ignoring the filter
+        self.sort_field = None  # None sorts by creation time
+        self.descending = True
+        self.status_filter = None
+        
+    def __len__(self):
+        return len(self.keys)
+        
+    def row(self, index):
+        """Item dict shown at a row of the sorted, filtered view"""
+        if self.descending:
+            index = len(self.keys) - 1 - index
+        return self.items[self.keys[index][-1]]
+        
+    def apply(self, changes):
+        """Apply a QueueManager.get_changes() result"""
+        if changes['reset']:
+            self.items.clear()
+            self.status_counts.clear()
+            
+        # Large batches are cheaper to sort once than to insert one by one
+        bulk = changes['reset'] or len(changes['changed']) > max(1000, len(self.keys) // 4)
+        
+        for item_id in changes['removed']:
+            item = self.items.pop(item_id, None)
+            if item is not None:
+                self._count(item['status'], -1)
+                if not bulk:
+                    self._unlist(item_id)
+                    
+        for item in changes['changed']:
+            old = self.items.get(item['id'])
+            if old is not None:
+                self._count(old['status'], -1)
+            self._count(item['status'], 1)
+            self.items[item['id']] = item
+            if bulk:
+                continue
+                
+            # Re-position the item only when its key or visibility changed
+            key = self._key(item) if self._passes(item) else None
+            if key != self.item_keys.get(item['id']):
+                self._unlist(item['id'])
+                if key is not None:
+                    insort(self.keys, key)
+                    self.item_keys[item['id']] = key
+                    
+        if bulk:
+            self._rebuild()
+            
+    def set_sort(self, field, descending=False):
+        """Sort by an item dict field, or by creation time if field is None"""
+        self.sort_field = field
+        self.descending = descending
+        self._rebuild()
+        
+    def set_filter(self, status):
+        """Show only items with a status, or all items if status is None"""
+        self.status_filter = status
+        self._rebuild()
+        
+    def _passes(self, item):
+        """Check an item against the status filter"""
+        return self.status_filter is None or item['status'] == self.status_filter
+        
+    def _key(self, item):
+        """Sort key, ending in the item id so every key is unique"""
+        created = item['created_at'].timestamp()
+        if self.sort_field is None:
+            return (created, item['id'])
+            
+        value = item.get(self.sort_field)
+        if isinstance(value, str):
+            value = value.lower()
+        # Missing values sort first, and the tuple keeps mixed types comparable
+        return (value is not None, value if value is not None else 0, created, item['id'])
+        
+    def _unlist(self, item_id):
+        """Remove an item from the sorted keys"""
+        key = self.item_keys.pop(item_id, None)
+        if key is not None:
+            index = bisect_left(self.keys, key)
+            del self.keys[index]
+            
+    def _rebuild(self):
+        """Recompute the sorted keys after the sort or filter changed"""
+        self.item_keys = {
+            item_id: self._key(item)
+            for item_id, item in self.items.items()
+            if self._passes(item)
+        }
+        self.keys = sorted(self.item_keys.values())
+        
+    def _count(self, status, delta):
+        """Adjust the per-status item count"""
+        self.status_counts[status] = self.status_counts.get(status, 0) + delta
@@ -6,12 +6,15 @@ import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import os
 
+from core.bandwidth_governor import parse_rate
+
 class SettingsDialog:
     """Settings configuration dialog"""
     
-    def __init__(self, parent, config):
+    def __init__(self, parent, config, on_apply=None):
         self.parent = parent
         self.config = config
+        self.on_apply = on_apply  # Called after settings are saved
         
         # Create dialog window
         self.dialog = tk.Toplevel(parent)
@@ -97,6 +100,19 @@ class SettingsDialog:
         self.embed_subs_var = tk.BooleanVar()
         ttk.Checkbutton(frame, text="Embed subtitles", variable=self.embed_subs_var).grid(row=8, column=0, sticky=tk.W, pady=2)
         
+        # Fragment concurrency for HLS/DASH streams
+        ttk.Label(frame, text="Concurrent Fragments:").grid(row=9, column=0, sticky=tk.W, pady=(10, 5))
+        self.concurrent_fragments_var = tk.IntVar()
+        ttk.Spinbox(frame, from_=1, to=16, textvariable=self.concurrent_fragments_var, width=10).grid(row=10, column=0, sticky=tk.W, pady=(0, 5))
+        
+        self.adaptive_fragments_var = tk.BooleanVar()
+        ttk.Checkbutton(frame, text="Adapt fragment concurrency to throughput and throttling", variable=self.adaptive_fragments_var).grid(row=11, column=0, sticky=tk.W, pady=2)
+        
+        # Bandwidth shared by all downloads; applies to running downloads too
+        ttk.Label(frame, text="Total Bandwidth Limit (e.g. 500K, 5M; 0 for unlimited):").grid(row=12, column=0, sticky=tk.W, pady=(10, 5))
+        self.rate_limit_var = tk.StringVar()
+        ttk.Entry(frame, textvariable=self.rate_limit_var, width=12).grid(row=13, column=0, sticky=tk.W, pady=(0, 10))
+        
         frame.columnconfigure(0, weight=1)
         
     def setup_processing_tab(self, notebook):
@@ -126,18 +142,25 @@ class SettingsDialog:
         ttk.Entry(yt_dlp_frame, textvariable=self.yt_dlp_path_var).grid(row=0, column=0, sticky=(tk.W, tk.E), padx=(0, 5))
         ttk.Button(yt_dlp_frame, text="Browse", command=self.browse_yt_dlp_path).grid(row=0, column=1)
         
+        # Download engine
+        ttk.Label(frame, text="Download Engine:").grid(row=4, column=0, sticky=tk.W, pady=(0, 5))
+        self.download_engine_var = tk.StringVar()
+        engine_combo = ttk.Combobox(frame, textvariable=self.download_engine_var, state="readonly")
+        engine_combo['values'] = ('auto', 'api', 'subprocess')
+        engine_combo.grid(row=5, column=0, sticky=(tk.W, tk.E), pady=(0, 10))
+        
         # Concurrent processing
-        ttk.Label(frame, text="Maximum Concurrent Downloads:").grid(row=4, column=0, sticky=tk.W, pady=(0, 5))
+        ttk.Label(frame, text="Maximum Concurrent Downloads:").grid(row=6, column=0, sticky=tk.W, pady=(0, 5))
         self.max_concurrent_var = tk.IntVar()
         concurrent_spin = ttk.Spinbox(frame, from_=1, to=8, textvariable=self.max_concurrent_var, width=10)
-        concurrent_spin.grid(row=5, column=0, sticky=tk.W, pady=(0, 10))
+        concurrent_spin.grid(row=7, column=0, sticky=tk.W, pady=(0, 10))
         
         # Processing options
         self.auto_process_var = tk.BooleanVar()
-        ttk.Checkbutton(frame, text="Auto-process downloaded files", variable=self.auto_process_var).grid(row=6, column=0, sticky=tk.W, pady=2)
+        ttk.Checkbutton(frame, text="Auto-process downloaded files", variable=self.auto_process_var).grid(row=8, column=0, sticky=tk.W, pady=2)
         
         self.delete_originals_var = tk.BooleanVar()
-        ttk.Checkbutton(frame, text="Delete original files after processing", variable=self.delete_originals_var).grid(row=7, column=0, sticky=tk.W, pady=2)
+        ttk.Checkbutton(frame, text="Delete original files after processing", variable=self.delete_originals_var).grid(row=9, column=0, sticky=tk.W, pady=2)
         
         frame.columnconfigure(0, weight=1)
         
@@ -247,10 +270,14 @@ class SettingsDialog:
         self.extract_audio_var.set(self.config.getboolean('download', 'extract_audio', fallback=False))
         self.keep_video_var.set(self.config.getboolean('download', 'keep_video', fallback=True))
         self.embed_subs_var.set(self.config.getboolean('download', 'embed_subs', fallback=False))
+        self.concurrent_fragments_var.set(self.config.getint('download', 'concurrent_fragments', fallback=4))
+        self.adaptive_fragments_var.set(self.config.getboolean('download', 'adaptive_fragments', fallback=True))
+        self.rate_limit_var.set(self.config.get('download', 'rate_limit', fallback='0'))
         
         # Processing settings
         self.ffmpeg_path_var.set(self.config.get('processing', 'ffmpeg_path', fallback='ffmpeg'))
         self.yt_dlp_path_var.set(self.config.get('processing', 'yt_dlp_path', fallback='yt-dlp'))
+        self.download_engine_var.set(self.config.get('processing', 'download_engine', fallback='auto'))
         self.max_concurrent_var.set(self.config.getint('processing', 'max_concurrent', fallback=2))
         self.auto_process_var.set(self.config.getboolean('processing', 'auto_process', fallback=True))
         self.delete_originals_var.set(self.config.getboolean('processing', 'delete_originals', fallback=False))
@@ -278,10 +305,17 @@ class SettingsDialog:
             self.config.set('download', 'extract_audio', str(self.extract_audio_var.get()))
             self.config.set('download', 'keep_video', str(self.keep_video_var.get()))
             self.config.set('download', 'embed_subs', str(self.embed_subs_var.get()))
+            self.config.set('download', 'concurrent_fragments', str(self.concurrent_fragments_var.get()))
+            self.config.set('download', 'adaptive_fragments', str(self.adaptive_fragments_var.get()))
+            rate_limit = self.rate_limit_var.get().strip() or '0'
+            if rate_limit != '0' and parse_rate(rate_limit) is None:
+                raise ValueError(f"Invalid bandwidth limit: {rate_limit}")
+            self.config.set('download', 'rate_limit', rate_limit)
             
             # Processing settings
             self.config.set('processing', 'ffmpeg_path', self.ffmpeg_path_var.get())
             self.config.set('processing', 'yt_dlp_path', self.yt_dlp_path_var.get())
+            self.config.set('processing', 'download_engine', self.download_engine_var.get())
             self.config.set('processing', 'max_concurrent', str(self.max_concurrent_var.get()))
             self.config.set('processing', 'auto_process', str(self.auto_process_var.get()))
             self.config.set('processing', 'delete_originals', str(self.delete_originals_var.get()))
@@ -302,6 +336,10 @@ class SettingsDialog:
             # Save settings
             self.config.save()
             
+            # Let running components pick up the new values
+            if self.on_apply:
+                self.on_apply()
+                
             messagebox.showinfo("Settings", "Settings applied successfully!")
             
         except Exception as e:
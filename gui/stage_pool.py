@@ -0,0 +1,76 @@
+"""
+Worker pools for the stages of the processing pipeline
+"""
+
+import threading
+from collections import deque
+
+class StagePool:
+    """Persistent worker threads draining a bounded hand-off queue for one pipeline stage"""
+    
+    def __init__(self, name, handler, workers, logger, capacity=None):
+        self.name = name
+        self.handler = handler
+        self.logger = logger
+        self.capacity = capacity  # None follows the worker count, 0 is unbounded
+        self.items = deque()
+        self.workers = 0
+        self.live_threads = 0
+        self.thread_count = 0
+        self.running = True
+        
+        lock = threading.Lock()
+        self.not_empty = threading.Condition(lock)
+        self.not_full = threading.Condition(lock)
+        self.resize(workers)
+        
+    def _limit(self):
+        """Current queue capacity; must hold the lock"""
+        return self.workers if self.capacity is None else self.capacity
+        
+    def submit(self, item):
+        """Hand an item to this stage, waiting for room in its queue"""
+        with self.not_full:
+            # Waiting here holds back the previous stage
+            while self.running and self._limit() and len(self.items) >= self._limit():
+                self.not_full.wait()
+            self.items.append(item)
+            self.not_empty.notify()
+            
+    def resize(self, workers):
+        """Change the number of workers; surplus workers exit after their current item"""
+        with self.not_empty:
+            self.workers = max(1, workers)
+            while self.live_threads < self.workers:
+                self.live_threads += 1
+                self.thread_count += 1
+                thread = threading.Thread(target=self._work, name=f"{self.name}-{self.thread_count}", daemon=True)
+                thread.start()
+                
+            # Wake idle workers so any surplus can exit, and submitters to recheck capacity
+            self.not_empty.notify_all()
+            self.not_full.notify_all()
+            
+    def _work(self):
+        """Worker loop; the handler is expected to deal with its own errors"""
+        while True:
+            with self.not_empty:
+                while self.running and not self.items and self.live_threads <= self.workers:
+                    self.not_empty.wait()
+                if not self.running or self.live_threads > self.workers:
+                    self.live_threads -= 1
+                    return
+                item = self.items.popleft()
+                self.not_full.notify()
+                
+            try:
+                self.handler(item)
+            except Exception as e:
+                self.logger.error(f"Error in {self.name} stage: {str(e)}")
+                
+    def stop(self):
+        """Ask the workers to exit once they finish their current item"""
+        with self.not_empty:
+            self.running = False
+            self.not_empty.notify_all()
+            self.not_full.notify_all()